@@ -0,0 +1,28 @@
+"""add tasks (user_id, created_at, id) index
+
+Revision ID: 3f1c2a7d9b10
+Revises:
+Create Date: 2026-10-17 22:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a7d9b10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keyset pagination of user's tasks ordered by (created_at, id)
+    op.create_index('ix_tasks_user_id_created_at_id', 'tasks', ['user_id', 'created_at', 'id'],
+                    unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_user_id_created_at_id', table_name='tasks', if_exists=True)
@@ -1,8 +1,11 @@
 """
-    Endpoints for health check
+    Endpoints for health checks and metrics
 """
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+
+from app.db.database import get_pool_stats
+from app.utils import metrics
 
 check_router = APIRouter(
     prefix="/checks",
@@ -14,3 +17,15 @@ check_router = APIRouter(
 async def health_check():
     """Health check test endpoint"""
     return {"status": "ok"}
+
+
+@check_router.get("/db-pool")
+async def db_pool_stats():
+    """Database connection pool usage and checkout wait time"""
+    return get_pool_stats()
+
+
+@check_router.get("/metrics")
+async def metrics_endpoint():
+    """Application metrics in Prometheus text format"""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
@@ -1,13 +1,39 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from collections import defaultdict
+from typing import Annotated, Literal
+from fastapi import APIRouter, Body, Depends, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from redis.asyncio import Redis
+from app.core.config import settings
+from app.db.redis import get_redis_async_session
+from app.services.task_cache import TaskCache
 from app.services.task_service import TaskService
-from app.utils.unitofwork import UnitOfWork, IUnitOfWork
-from app.utils.websocket import ConnectionManager
+from app.utils.unitofwork import IUnitOfWork, get_unit_of_work
+from app.utils.websocket import ConnectionManager, parse_task_topic, task_topic
+from app.utils.broadcast import broadcast_backend
 from app.api import schemas
+from app.api.schemas.user import User
 from app.core.security import get_current_user, get_current_user_websocket
 
 
-async def get_task_service(uow: IUnitOfWork = Depends(UnitOfWork)) -> TaskService:
-    return TaskService(uow)
+async def get_task_service(uow: IUnitOfWork = Depends(get_unit_of_work),
+                           redis_session: Redis = Depends(get_redis_async_session)) -> TaskService:
+    cache = TaskCache(redis_session) if settings.TASK_CACHE_ENABLED else None
+    return TaskService(uow, cache)
+
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+# Related objects which read endpoints can embed into tasks: include=user adds task owner
+Include = Literal['user'] | None
+
+
+def json_response(adapter: TypeAdapter, content, headers: dict[str, str] | None = None) -> Response:
+    """
+        Serialize content which is already validated in a single pass.
+        FastAPI returns Response as is, so content isn't validated and encoded once again
+        by response_model, while JSON stays the same
+    """
+    return Response(adapter.dump_json(content), media_type='application/json', headers=headers)
 
 
 tasks_router = APIRouter(
@@ -22,37 +48,70 @@ websocket_router = APIRouter(
     dependencies=[Depends(get_current_user_websocket)]
 )
 
-ws_manager = ConnectionManager()
+ws_manager = ConnectionManager(backend=broadcast_backend)
+TaskBatch = Annotated[list[schemas.Task], Body(min_length=1, max_length=settings.TASKS_MAX_BATCH_SIZE)]
 
 
-@tasks_router.post("/create")
-async def create_task(task: schemas.Task, service: TaskService = Depends(get_task_service)) -> schemas.Task:
-    """Create task"""
-    return await service.create(task)
+async def notify_completed(tasks: list[schemas.Task]):
+    """Notify owners and subscribers about completed tasks, one message per owner"""
+    tasks_by_owner: dict[int, list[schemas.Task]] = defaultdict(list)
+    for task in tasks:
+        tasks_by_owner[task.user_id].append(task)
+    for user_id, owner_tasks in tasks_by_owner.items():
+        if len(owner_tasks) == 1:
+            message = f"Task #{owner_tasks[0].id} called \"{owner_tasks[0].name}\" is completed"
+        else:
+            message = "Tasks " + ", ".join(f"#{task.id} \"{task.name}\"" for task in owner_tasks) + " are completed"
+        await ws_manager.notify(message, users=[user_id], topics=[task_topic(task.id) for task in owner_tasks])
 
 
-@tasks_router.get("/read-all/{user_id}")
-async def get_tasks(user_id: int, service: TaskService = Depends(get_task_service)) -> list[schemas.Task]:
-    """Get all tasks"""
-    return await service.get_all(user_id)
-
-
-@tasks_router.get("/read/{id_}")
-async def get_task(id_: int, service: TaskService = Depends(get_task_service)) -> schemas.Task:
+@tasks_router.post("/create", response_model=schemas.Task)
+async def create_task(task: schemas.Task, service: TaskService = Depends(get_task_service)) -> Response:
+    """Create task"""
+    return json_response(schemas.task_adapter, await service.create(task))
+
+
+@tasks_router.get("/read-all/{user_id}", response_model=list[schemas.Task])
+async def get_tasks(user_id: int,
+                    limit: Annotated[int, Query(ge=1, le=settings.TASKS_MAX_PAGE_SIZE)] = settings.TASKS_PAGE_SIZE,
+                    cursor: str | None = None,
+                    completed: bool | None = None,
+                    include: Include = None,
+                    service: TaskService = Depends(get_task_service)) -> Response:
+    """
+        Get page of user's tasks ordered by creation time.
+        Cursor of the next page (if any) is returned in X-Next-Cursor header
+    """
+    page = await service.get_all(user_id, limit, cursor, completed, include_user=include == 'user')
+    headers = {NEXT_CURSOR_HEADER: page.next_cursor} if page.next_cursor else None
+    return json_response(schemas.task_list_adapter, page.items, headers)
+
+
+@tasks_router.get("/export/{user_id}", response_class=StreamingResponse)
+async def export_tasks(user_id: int,
+                       completed: bool | None = None,
+                       include: Include = None,
+                       service: TaskService = Depends(get_task_service)) -> StreamingResponse:
+    """Export all user's tasks as NDJSON stream, one task per line"""
+    return StreamingResponse(service.export(user_id, completed, include_user=include == 'user'),
+                             media_type='application/x-ndjson')
+
+
+@tasks_router.get("/read/{id_}", response_model=schemas.Task)
+async def get_task(id_: int, include: Include = None,
+                   service: TaskService = Depends(get_task_service)) -> Response:
     """Get task by id"""
-    return await service.read(id_)
+    return json_response(schemas.task_adapter, await service.read(id_, include_user=include == 'user'))
 
 
-@tasks_router.put("/update")
-async def update_task(task: schemas.Task, service: TaskService = Depends(get_task_service)) -> schemas.Task:
+@tasks_router.put("/update", response_model=schemas.Task)
+async def update_task(task: schemas.Task, service: TaskService = Depends(get_task_service)) -> Response:
     """Update task"""
-    old_task = await service.read(task.id)
-    task = await service.update(task)
-    # Probably old_task is expired
-    if task.completed and not old_task.completed:
-        # Notify all connected to /ws endpoint abous status changes
-        await ws_manager.broadcast(f"Task #{task.id} called \"{task.name}\" is completed")
-    return task
+    task, became_completed = await service.update_with_transition(task)
+    if became_completed:
+        # Notify task owner and subscribers of the task about status changes
+        await notify_completed([task])
+    return json_response(schemas.task_adapter, task)
 
 
 @tasks_router.delete("/delete/{id_}")
@@ -61,16 +120,74 @@ async def delete_task(id_: int, service: TaskService = Depends(get_task_service)
     return await service.delete(id_)
 
 
+@tasks_router.post("/bulk/create", response_model=list[schemas.TaskBatchResult])
+async def create_tasks(tasks: TaskBatch, service: TaskService = Depends(get_task_service)) -> Response:
+    """Create batch of tasks in single transaction"""
+    return json_response(schemas.task_batch_result_list_adapter, await service.create_many(tasks))
+
+
+@tasks_router.put("/bulk/update", response_model=list[schemas.TaskBatchResult])
+async def update_tasks(tasks: TaskBatch, service: TaskService = Depends(get_task_service)) -> Response:
+    """Update batch of tasks in single transaction"""
+    results, completed = await service.update_many(tasks)
+    if completed:
+        await notify_completed(completed)
+    return json_response(schemas.task_batch_result_list_adapter, results)
+
+
+@tasks_router.post("/bulk/delete", response_model=list[schemas.TaskBatchResult])
+async def delete_tasks(ids: Annotated[list[int], Body(min_length=1, max_length=settings.TASKS_MAX_BATCH_SIZE)],
+                       service: TaskService = Depends(get_task_service)) -> Response:
+    """Delete batch of tasks by ids in single transaction"""
+    return json_response(schemas.task_batch_result_list_adapter, await service.delete_many(ids))
+
+
+async def can_subscribe(service: TaskService, topic: str, user_id: int) -> bool:
+    """Only topics of form task:<id> of user's own tasks can be subscribed to"""
+    task_id = parse_task_topic(topic)
+    if task_id is None:
+        return False
+    try:
+        return await service.is_owner(task_id, user_id)
+    finally:
+        # Socket lives long, database connection isn't held between its messages
+        await service.uow.close()
+
+
 @websocket_router.websocket("/init/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: int | None = 0):
-    """WebSocket endpoint"""
-    await ws_manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket,
+                             current_user: Annotated[User, Depends(get_current_user_websocket)],
+                             client_id: int | None = 0,
+                             service: TaskService = Depends(get_task_service)):
+    """
+        WebSocket endpoint.
+
+        Client receives notifications about its own tasks. Sending "/subscribe <topic>" or
+        "/unsubscribe <topic>" (e.g. "/subscribe task:42") manages additional subscriptions
+        to user's own tasks, any other text is broadcast to everyone
+    """
+    await ws_manager.connect(websocket, current_user.id)
     try:
         while True:
             data = await websocket.receive_text()
+            command, _, topic = data.partition(' ')
+            topic = topic.strip()
+            if command == '/subscribe' and topic:
+                if await can_subscribe(service, topic, current_user.id) and ws_manager.subscribe(websocket, topic):
+                    await ws_manager.send_personal_message(f"Subscribed to {topic}", websocket)
+                else:
+                    await ws_manager.send_personal_message(f"Can't subscribe to {topic}", websocket)
+                continue
+            if command == '/unsubscribe' and topic:
+                ws_manager.unsubscribe(websocket, topic)
+                await ws_manager.send_personal_message(f"Unsubscribed from {topic}", websocket)
+                continue
             await ws_manager.send_personal_message(f"You wrote: {data}", websocket)
             await ws_manager.broadcast(f"Client #{client_id} says: {data}")
     except WebSocketDisconnect:
         ws_manager.disconnect(websocket)
         await ws_manager.broadcast(f"Client #{client_id} left the chat")
+    finally:
+        # Other errors must not leave connection registered either
+        ws_manager.disconnect(websocket)
 
@@ -1,23 +1,147 @@
+import json
 import logging
+import queue
+import random
 import sys
-from fastapi import Request
+import time
+from logging.handlers import QueueHandler, QueueListener
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from redis import asyncio as aioredis
+
+from app.core.config import settings
+from app.core.security import get_user_from_token
+from app.db.redis_connection import pool
+from app.utils.metrics import REQUEST_LATENCY, REQUESTS_IN_FLIGHT
+from app.utils.rate_limit import RateLimit, RateLimiter, retry_after_header
+
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class JsonFormatter(logging.Formatter):
+    """Format access log record as single line of JSON"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'logger': record.name,
+            'level': record.levelname,
+            **getattr(record, 'access', {}),
+        }
+        return json.dumps(entry, separators=(',', ':'))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler which drops records instead of blocking when queue is full"""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Message is rendered by listener's formatter, so no formatting happens on event loop
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-# StreamHandler for console output
+logger.propagate = False
+# Records are written to stdout by listener thread, request handling only puts them to queue
+log_queue = queue.Queue(maxsize=settings.ACCESS_LOG_QUEUE_SIZE)
+logger.addHandler(DroppingQueueHandler(log_queue))
 ch = logging.StreamHandler(sys.stdout)
 ch.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-ch.setFormatter(formatter)
-logger.addHandler(ch)
+ch.setFormatter(JsonFormatter())
+log_listener = QueueListener(log_queue, ch, respect_handler_level=True)
+
+
+def start_access_log():
+    """Start thread writing access log"""
+    if log_listener._thread is None:
+        log_listener.start()
+
+
+def stop_access_log():
+    """Flush access log and stop its thread"""
+    if log_listener._thread is not None:
+        log_listener.stop()
+
+
+def should_log(status_code: int) -> bool:
+    """Successful responses are sampled, all others are logged"""
+    if 200 <= status_code < 300:
+        return random.random() < settings.ACCESS_LOG_SAMPLE_RATE
+    return True
+
 
 async def logging_middleware(request: Request, call_next):
-    """Logging middleware"""
-    logger.info("=======logging info=======")
-    logger.info(f"Request: {request.method} {request.url}")
-    logger.info("=======logging info=======")
-    response = await call_next(request)
-    logger.info("=======logging info=======")
-    logger.info(f"Response: {response.status_code}")
-    logger.info("=======logging info=======")
-    return response
+    """Access log and request metrics middleware"""
+    start = time.perf_counter()
+    status_code = 500
+    REQUESTS_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        duration = time.perf_counter() - start
+        REQUESTS_IN_FLIGHT.dec()
+        route = request.scope.get('route')
+        # Unmatched paths share one label so that scanners can't blow up number of series
+        route_path = route.path if route is not None else None
+        REQUEST_LATENCY.observe(duration, request.method, route_path or UNMATCHED_ROUTE, status_code)
+        if should_log(status_code):
+            logger.info('access', extra={'access': {
+                'method': request.method,
+                'route': route_path,
+                'path': request.url.path,
+                'status': status_code,
+                'duration_ms': round(duration * 1000, 3),
+            }})
+
+
+def sort_rate_limits(limits: dict[str, tuple[int, float]]) -> list[tuple[str, RateLimit]]:
+    """Longest prefixes first, so that the most specific limit wins"""
+    return sorted(((prefix, RateLimit(*limit)) for prefix, limit in limits.items()),
+                  key=lambda item: len(item[0]), reverse=True)
+
+
+rate_limiter = RateLimiter(aioredis.Redis(connection_pool=pool))
+rate_limits = sort_rate_limits(settings.RATE_LIMITS)
+
+
+def get_rate_limit(path: str) -> tuple[str, RateLimit] | None:
+    """Limit applied to path with its prefix"""
+    for prefix, limit in rate_limits:
+        if path.startswith(prefix):
+            return prefix, limit
+    return None
+
+
+def get_principal(request: Request) -> str:
+    """User of bearer token, or client address if request is anonymous or token is invalid"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and token:
+        try:
+            user = get_user_from_token(token)
+            return f'user:{user.id if user.id is not None else user.login}'
+        except HTTPException:
+            pass
+    return f'ip:{request.client.host if request.client else None}'
+
+
+async def rate_limit_middleware(request: Request, call_next):
+    """Reject requests of clients exceeding their rate limit"""
+    rate_limit = get_rate_limit(request.url.path) if settings.RATE_LIMIT_ENABLED else None
+    if rate_limit is not None:
+        prefix, limit = rate_limit
+        allowed, retry_after = await rate_limiter.hit(f'{prefix}:{get_principal(request)}', limit)
+        if not allowed:
+            return JSONResponse({'detail': 'Too many requests'}, status_code=429,
+                                headers={'Retry-After': retry_after_header(retry_after)})
+    return await call_next(request)
@@ -1 +1 @@
-from .task import Task
+from .task import Task, TaskPage, TaskBatchResult, task_adapter, task_list_adapter, task_batch_result_list_adapter
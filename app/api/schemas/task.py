@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 from datetime import datetime
 from .user import User
 
@@ -13,3 +13,24 @@ class Task(BaseModel):
     created_at: datetime | None = None
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class TaskPage(BaseModel):
+    """Page of tasks with cursor of the next one"""
+    items: list[Task]
+    next_cursor: str | None = None
+
+
+class TaskBatchResult(BaseModel):
+    """Result of processing single item of batch request"""
+    index: int
+    status: int
+    id: int | None = None
+    task: Task | None = None
+    error: str | None = None
+
+
+# Serializers of already validated tasks, used to render responses and cache entries in one pass
+task_adapter = TypeAdapter(Task)
+task_list_adapter = TypeAdapter(list[Task])
+task_batch_result_list_adapter = TypeAdapter(list[TaskBatchResult])
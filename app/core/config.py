@@ -1,5 +1,6 @@
 import os
 from functools import lru_cache
+from typing import Literal
 from pydantic_settings import BaseSettings
 
 
@@ -16,7 +17,63 @@ class Settings(BaseSettings):
     USER_PASSWORD_SALT: str
     REFRESH_TOKEN_PASSWORD_SALT: str
     REDIS_URL: str
-
+    # Websocket fan-out: size of per-connection outbound queue, timeout of a single send
+    # and what to do with a client whose queue is full ('drop_message' or 'disconnect')
+    WS_SEND_QUEUE_SIZE: int = 100
+    WS_SEND_TIMEOUT: float = 5.0
+    WS_SLOW_CONSUMER_POLICY: Literal['drop_message', 'disconnect'] = 'drop_message'
+    # Max number of topics a single websocket connection can be subscribed to
+    WS_MAX_TOPICS: int = 100
+    # Bus spreading websocket broadcasts over all workers. 'memory' works within single process only
+    BROADCAST_BACKEND: Literal['redis', 'memory'] = 'redis'
+    # Thread pool for password hashing: number of threads and max number of jobs running or waiting
+    CRYPTO_MAX_WORKERS: int = 4
+    CRYPTO_MAX_PENDING: int = 64
+    # Hashing of refresh tokens and fingerprints. Hashes made by 'bcrypt' are still verified under 'hmac-sha256'
+    TOKEN_HASH_SCHEME: Literal['hmac-sha256', 'bcrypt'] = 'hmac-sha256'
+    # Max number of decoded access tokens cached per worker, 0 disables cache
+    ACCESS_TOKEN_CACHE_SIZE: int = 10000
+    # Per-worker cache of user claims used to reissue tokens: max number of users (0 disables it) and lifetime (seconds)
+    USER_CLAIMS_CACHE_SIZE: int = 10000
+    USER_CLAIMS_CACHE_TTL: float = 300.0
+    # Redis cache of tasks: switch, lifetime of entries (seconds) and how long a loader may hold its lock
+    TASK_CACHE_ENABLED: bool = True
+    TASK_CACHE_TTL: int = 60
+    TASK_CACHE_LOCK_TIMEOUT: float = 5.0
+    # Default and max number of tasks per page of task list
+    TASKS_PAGE_SIZE: int = 100
+    TASKS_MAX_PAGE_SIZE: int = 1000
+    # Number of rows fetched from server-side cursor at once while exporting tasks
+    TASKS_EXPORT_BATCH_SIZE: int = 1000
+    # Max number of items in single batch request
+    TASKS_MAX_BATCH_SIZE: int = 1000
+    # Database engine: SQL echo, connection pool limits (timeout and recycle in seconds, recycle -1 disables it),
+    # liveness check of connection on checkout and size of asyncpg prepared statements cache per connection
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = -1
+    DB_POOL_PRE_PING: bool = False
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 100
+    # Access log: fraction of 2xx responses logged (others are always logged)
+    # and max number of records waiting for writer thread, extra ones are dropped
+    ACCESS_LOG_SAMPLE_RATE: float = 1.0
+    ACCESS_LOG_QUEUE_SIZE: int = 10000
+    # Whether login over sessions limit evicts the oldest session of user instead of being rejected
+    SESSION_EVICT_OLDEST: bool = False
+    # Background deletion of expired sessions: pause between sweeps (seconds) and sessions checked per script call
+    SESSION_SWEEP_INTERVAL: float = 60.0
+    SESSION_SWEEP_BATCH_SIZE: int = 100
+    # Rate limits per client: path prefix -> (requests, period in seconds). The longest matching prefix applies.
+    # Client is user of bearer token or IP address for anonymous requests
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMITS: dict[str, tuple[int, float]] = {
+        '/auth/login': (10, 60),
+        '/auth/register': (5, 60),
+        '/auth/reissue-tokens/': (30, 60),
+        '/tasks/': (600, 60),
+    }
 
     @property
     def ASYNC_DATABASE_URL(self):
@@ -34,6 +91,8 @@ class Settings(BaseSettings):
 
 class DevSettings(Settings):
     """Settings for development environment"""
+    DB_ECHO: bool = True
+
     class Config:
         """Config for development environment"""
         env_file = ".dev.env"
@@ -48,6 +107,12 @@ class TestSettings(Settings):
 
 class ProdSettings(Settings):
     """Settings for production environment"""
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 10.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+
     class Config:
         """Config for production environment"""
         env_file = ".prod.env"
@@ -61,6 +126,9 @@ class TestDockerSettings(Settings):
 
 class DockerSettings(Settings):
     """Settings for docker environment"""
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+
     class Config:
         """Config for docker environment"""
         env_file = ".docker.env"
@@ -1,15 +1,22 @@
 """
     Contains functions for working with JWT and auth process
 """
+import asyncio
+import hashlib
+import hmac
 import secrets
 import uuid
-from typing import Annotated
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Annotated, Callable
 from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException, status, WebSocket
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from passlib.context import CryptContext
 from app.api.schemas import user
+from app.utils.cache import ExpiringLRUCache
 from .config import settings
 
 
@@ -19,6 +26,7 @@ REFRESH_TOKEN_EXPIRATION_TIME = timedelta(days=2)
 REFRESH_TOKEN_HEADER = 'X-Refresh-Token'
 FINGERPRINT_HEADER = 'X-Fingerprint'
 REDIS_USERS_TOKEN_DATA_KEY = 'users_token_data'
+REDIS_USERS_TOKEN_EXPIRY_KEY = 'users_token_expiry'
 MAX_CONCURRENT_USER_SESSIONS = 5
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -33,6 +41,98 @@ expiration_exception = HTTPException(
     detail="Token's expired. Try to obtain one more",
     headers={"WWW-Authenticate": "Bearer"},
 )
+crypto_overload_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Server is busy. Try again later",
+    headers={"Retry-After": "1"},
+)
+
+
+class CryptoPool:
+    """
+        Bounded thread pool for CPU-heavy crypto (bcrypt releases GIL, so threads are enough).
+        Keeps event loop free while hashing and rejects jobs once too many of them are waiting
+    """
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='crypto')
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Run function in pool. Raises 503 error if queue is full"""
+        if self.pending >= self.max_pending:
+            raise crypto_overload_exception
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        """Shutdown pool"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+crypto_pool = CryptoPool(settings.CRYPTO_MAX_WORKERS, settings.CRYPTO_MAX_PENDING)
+# Verified access token -> user encoded in it
+access_token_cache = ExpiringLRUCache(settings.ACCESS_TOKEN_CACHE_SIZE)
+
+
+class TokenHasher(ABC):
+    """Strategy of hashing high-entropy secrets (refresh tokens, fingerprints) before storing them"""
+    # Whether hasher is a slow KDF which has to be run in crypto pool
+    slow: bool = False
+
+    @abstractmethod
+    def hash(self, token: str) -> str:
+        ...
+
+    @abstractmethod
+    def verify(self, token: str, hashed: str) -> bool:
+        ...
+
+    @abstractmethod
+    def identify(self, hashed: str) -> bool:
+        """Whether hash was produced by this hasher"""
+
+
+class BcryptTokenHasher(TokenHasher):
+    """Bcrypt hasher. Legacy: slow KDF gives nothing for random tokens but burns CPU"""
+    slow = True
+
+    def hash(self, token: str) -> str:
+        return hash_password(token, salt=settings.REFRESH_TOKEN_PASSWORD_SALT)
+
+    def verify(self, token: str, hashed: str) -> bool:
+        return verify_password(token, hashed, salt=settings.REFRESH_TOKEN_PASSWORD_SALT)
+
+    def identify(self, hashed: str) -> bool:
+        return pwd_context.identify(hashed) is not None
+
+
+class HmacTokenHasher(TokenHasher):
+    """HMAC-SHA256 hasher keyed by REFRESH_TOKEN_PASSWORD_SALT"""
+    prefix = 'hmac-sha256$'
+
+    def __init__(self, key: str = settings.REFRESH_TOKEN_PASSWORD_SALT):
+        self._key = key.encode()
+
+    def hash(self, token: str) -> str:
+        return self.prefix + hmac.new(self._key, token.encode(), hashlib.sha256).hexdigest()
+
+    def verify(self, token: str, hashed: str) -> bool:
+        return hmac.compare_digest(self.hash(token), hashed)
+
+    def identify(self, hashed: str) -> bool:
+        return hashed.startswith(self.prefix)
+
+
+TOKEN_HASHERS: dict[str, TokenHasher] = {
+    'hmac-sha256': HmacTokenHasher(),
+    'bcrypt': BcryptTokenHasher(),
+}
+# Hasher for new tokens. Tokens hashed by another one are still verified (see get_token_hasher)
+token_hasher = TOKEN_HASHERS[settings.TOKEN_HASH_SCHEME]
 
 
 def create_access_token(data: dict) -> str:
@@ -55,14 +155,32 @@ def create_refresh_token(data: dict) -> tuple[str, str]:
         'exp': datetime.now(timezone.utc) + REFRESH_TOKEN_EXPIRATION_TIME
     })
     token = jwt.encode(data, settings.JWT_REFRESH_SECRET_KEY, algorithm=ALGORITHM)
-    return token, hash_password(token, salt=settings.REFRESH_TOKEN_PASSWORD_SALT)
+    return token, token_hasher.hash(token)
 
 def create_refresh_token_uuid() -> tuple[uuid.UUID, str]:
     """
         Creates refresh token as UUID
     """
     token = uuid.uuid4()
-    return token, hash_password(str(token), salt=settings.REFRESH_TOKEN_PASSWORD_SALT)
+    return token, token_hasher.hash(str(token))
+
+
+def get_token_hasher(hashed: str) -> TokenHasher:
+    """Returns hasher which produced hashed token, so hashes of every scheme keep working"""
+    if token_hasher.identify(hashed):
+        return token_hasher
+    for hasher in TOKEN_HASHERS.values():
+        if hasher.identify(hashed):
+            return hasher
+    raise ValueError("Unknown token hash format")
+
+
+def verify_token(token: str, hashed: str) -> bool:
+    """Verifies raw token against its stored hash"""
+    try:
+        return get_token_hasher(hashed).verify(token, hashed)
+    except ValueError:
+        return False
 
 
 def decode_jwt_token(token: str, secret_key: str) -> dict:
@@ -75,20 +193,35 @@ def decode_jwt_token(token: str, secret_key: str) -> dict:
         raise credentials_exception
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
-    """Returns info about current logged user"""
+def get_user_from_token(token: str) -> user.User:
+    """
+        Returns user encoded in access token.
+        Verified tokens are cached until their expiration, so repeated requests skip decoding
+    """
+    current_user = access_token_cache.get(token)
+    if current_user is not None:
+        return current_user
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[ALGORITHM])
-        return user.User(
-            login=payload.get('sub'),
-            name=payload.get('name'),
-            surname=payload.get('surname'),
-            roles=payload.get('roles')
-        )
     except jwt.ExpiredSignatureError:
         raise expiration_exception
     except jwt.InvalidTokenError:
         raise credentials_exception
+    current_user = user.User(
+        id=payload.get('id'),
+        login=payload.get('sub'),
+        name=payload.get('name'),
+        surname=payload.get('surname'),
+        roles=payload.get('roles')
+    )
+    if 'exp' in payload:
+        access_token_cache.set(token, current_user, payload['exp'])
+    return current_user
+
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+    """Returns info about current logged user"""
+    return get_user_from_token(token)
 
 
 async def get_current_user_websocket(websocket: WebSocket):
@@ -97,18 +230,7 @@ async def get_current_user_websocket(websocket: WebSocket):
     token = auth_header.split(' ')[-1].strip() if auth_header else None
     if token is None:
         raise credentials_exception
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[ALGORITHM])
-        return user.User(
-            login=payload.get('sub'),
-            name=payload.get('name'),
-            surname=payload.get('surname'),
-            roles=payload.get('roles')
-        )
-    except jwt.ExpiredSignatureError:
-        raise expiration_exception
-    except jwt.InvalidTokenError:
-        raise credentials_exception
+    return get_user_from_token(token)
 
 
 def hash_password(password: str, salt: str =settings.USER_PASSWORD_SALT) -> str:
@@ -123,4 +245,39 @@ def verify_password(plain_password, hashed_password, salt: str =settings.USER_PA
 
 def create_fingerprint(login: str) -> str:
     """Creates fingerprint"""
-    return pwd_context.hash(login + ':' + secrets.token_hex(nbytes=32))
+    return token_hasher.hash(login + ':' + secrets.token_hex(nbytes=32))
+
+
+async def hash_password_async(password: str, salt: str = settings.USER_PASSWORD_SALT) -> str:
+    """Return hashed version of password computed in crypto pool"""
+    return await crypto_pool.run(hash_password, password, salt)
+
+
+async def verify_password_async(plain_password, hashed_password, salt: str = settings.USER_PASSWORD_SALT) -> bool:
+    """Verifies raw and hashed password in crypto pool"""
+    return await crypto_pool.run(verify_password, plain_password, hashed_password, salt)
+
+
+async def create_fingerprint_async(login: str) -> str:
+    """Creates fingerprint, in crypto pool if token hasher is slow"""
+    if token_hasher.slow:
+        return await crypto_pool.run(create_fingerprint, login)
+    return create_fingerprint(login)
+
+
+async def create_refresh_token_uuid_async() -> tuple[uuid.UUID, str]:
+    """Creates refresh token as UUID, in crypto pool if token hasher is slow"""
+    if token_hasher.slow:
+        return await crypto_pool.run(create_refresh_token_uuid)
+    return create_refresh_token_uuid()
+
+
+async def verify_token_async(token: str, hashed: str) -> bool:
+    """Verifies raw token against its stored hash, in crypto pool if hash is produced by slow hasher"""
+    try:
+        hasher = get_token_hasher(hashed)
+    except ValueError:
+        return False
+    if hasher.slow:
+        return await crypto_pool.run(hasher.verify, token, hashed)
+    return hasher.verify(token, hashed)
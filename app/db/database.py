@@ -1,12 +1,85 @@
+import time
+
+from sqlalchemy import exc
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.core.config import settings
+from app.utils.metrics import Counter, Gauge, registry
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Connection pool measuring how long checkouts wait for connection"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_time_total += elapsed
+            self.wait_time_max = max(self.wait_time_max, elapsed)
 
 
-engine = create_async_engine(settings.ASYNC_DATABASE_URL, echo=True)
+engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    echo=settings.DB_ECHO,
+    poolclass=InstrumentedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    connect_args={'prepared_statement_cache_size': settings.DB_PREPARED_STATEMENT_CACHE_SIZE},
+)
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession)
 
 
 async def get_async_session():
     async with async_session_maker() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+def get_pool_stats() -> dict:
+    """Live stats of database connection pool"""
+    pool = engine.sync_engine.pool
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    stats = {
+        'size': pool.size(),
+        'max_overflow': pool._max_overflow,
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+        'saturation': pool.checkedout() / capacity if capacity else 0.0,
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update({
+            'checkouts': pool.checkouts,
+            'timeouts': pool.timeouts,
+            'wait_time_total': pool.wait_time_total,
+            'wait_time_max': pool.wait_time_max,
+            'wait_time_avg': pool.wait_time_total / pool.checkouts if pool.checkouts else 0.0,
+        })
+    return stats
+
+
+registry.register(Gauge(
+    'db_pool_connections', 'Database pool connections by state', ('state',),
+    callback=lambda: {(state,): value for state, value in get_pool_stats().items()
+                      if state in ('size', 'checked_in', 'checked_out', 'overflow')}))
+registry.register(Counter(
+    'db_pool_checkout_wait_seconds_total', 'Total time spent waiting for database connection',
+    callback=lambda: get_pool_stats().get('wait_time_total', 0.0)))
+registry.register(Counter(
+    'db_pool_checkout_timeouts_total', 'Number of database connection checkouts which timed out',
+    callback=lambda: get_pool_stats().get('timeouts', 0)))
@@ -1,6 +1,6 @@
 import datetime
 
-from sqlalchemy import BigInteger, SmallInteger, DateTime, func, String, Boolean, ForeignKey
+from sqlalchemy import BigInteger, SmallInteger, DateTime, func, String, Boolean, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -25,6 +25,10 @@ class User(Base):
 class Task(Base):
     """Task model"""
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Keyset pagination of user's tasks
+        Index('ix_tasks_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, index=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False)
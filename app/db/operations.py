@@ -25,14 +25,14 @@ async def get_user(session: AsyncSession, id_: int) -> models.User:
     return result.scalar_one()
 
 
-async def get_user_by_login(session: AsyncSession, login: str) -> models.User:
-    """Get db user by login"""
+async def get_user_by_login(session: AsyncSession, login: str) -> models.User | None:
+    """Get db user by login, None if there is no such user"""
     result = await session.execute(select(models.User).where(models.User.login == login).limit(1))
-    return result.scalar_one()
+    return result.scalar_one_or_none()
 
 
-async def login_user(session: AsyncSession, login: str, db_user: models.User = None) -> models.User:
-    """login user in db"""
+async def login_user(session: AsyncSession, login: str):
+    """Mark user as logged"""
     statement = update(models.User).where(models.User.login == login).values(
         {
             'logged': True
@@ -40,9 +40,6 @@ async def login_user(session: AsyncSession, login: str, db_user: models.User = N
     )
     await session.execute(statement)
     await session.commit()
-    if db_user:
-        await session.refresh(db_user)
-    return
 
 
 async def logout_user(session: AsyncSession, login: str) -> models.User:
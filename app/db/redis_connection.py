@@ -1,4 +1,19 @@
 from redis import asyncio as aioredis
 from app.core.config import settings
+from app.utils.metrics import Gauge, registry
 
 pool = aioredis.ConnectionPool.from_url(settings.REDIS_URL)
+
+
+def get_pool_stats() -> dict:
+    """Current usage of redis connection pool"""
+    return {
+        'in_use': len(pool._in_use_connections),
+        'available': len(pool._available_connections),
+        'max': pool.max_connections,
+    }
+
+
+registry.register(Gauge(
+    'redis_pool_connections', 'Redis pool connections by state', ('state',),
+    callback=lambda: {(state,): value for state, value in get_pool_stats().items()}))
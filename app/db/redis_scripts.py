@@ -0,0 +1,104 @@
+"""
+    Lua scripts executed atomically by Redis.
+
+    Scripts are registered once per process and called with EVALSHA,
+    redis client loads a script by itself if server doesn't know it yet.
+"""
+from redis import asyncio as aioredis
+from app.db.redis_connection import pool
+
+# Store user session unless user has reached sessions limit.
+# Existing session with the same fingerprint is replaced and doesn't count against the limit.
+# When limit is reached expired sessions are pruned first, then the oldest session is evicted if allowed,
+# otherwise session is rejected. Stored session is scheduled for sweeping by its expiry time
+# and hash lives as long as its newest session.
+# KEYS[1] - hash of user sessions, KEYS[2] - sorted set of sessions by expiry time
+# ARGV[1] - fingerprint, ARGV[2] - session data, ARGV[3] - max sessions (0 - no limit), ARGV[4] - evict oldest (0/1),
+# ARGV[5] - current unix time, ARGV[6] - session expiry unix time, ARGV[7] - member of expiry set, ARGV[8] - hash TTL
+# Returns 1 if session is stored, 0 if rejected
+ADMIT_SESSION = """
+local max_sessions = tonumber(ARGV[3])
+if max_sessions > 0 and redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0
+        and redis.call('HLEN', KEYS[1]) >= max_sessions then
+    local now = tonumber(ARGV[5])
+    local sessions = redis.call('HGETALL', KEYS[1])
+    local count = #sessions / 2
+    local oldest, oldest_created_at
+    for i = 1, #sessions, 2 do
+        local ok, session = pcall(cjson.decode, sessions[i + 1])
+        if ok and tonumber(session['expires_at']) and tonumber(session['expires_at']) <= now then
+            redis.call('HDEL', KEYS[1], sessions[i])
+            count = count - 1
+        else
+            -- created_at is UTC timestamp of the same format for all sessions, so strings are comparable
+            local created_at = ok and session['created_at'] or ''
+            if oldest == nil or created_at < oldest_created_at then
+                oldest, oldest_created_at = sessions[i], created_at
+            end
+        end
+    end
+    if count >= max_sessions then
+        if ARGV[4] ~= '1' then
+            return 0
+        end
+        redis.call('HDEL', KEYS[1], oldest)
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[6], ARGV[7])
+redis.call('EXPIRE', KEYS[1], ARGV[8])
+return 1
+"""
+
+# Delete a batch of expired sessions.
+# Members of expiry set are JSON arrays [login, fingerprint]. Session is deleted only if it is still expired,
+# since it could have been renewed under the same fingerprint after member was scored.
+# Session hashes are derived from members, so the script needs all keys on one node (no cluster).
+# KEYS[1] - sorted set of sessions by expiry time
+# ARGV[1] - current unix time, ARGV[2] - max number of sessions to check, ARGV[3] - prefix of session hashes
+# Returns number of members removed from expiry set
+SWEEP_SESSIONS = """
+local now = tonumber(ARGV[1])
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(members) do
+    local ok, entry = pcall(cjson.decode, member)
+    if ok then
+        local hash_name = ARGV[3] .. ':' .. entry[1]
+        local data = redis.call('HGET', hash_name, entry[2])
+        if data then
+            local decoded, session = pcall(cjson.decode, data)
+            local expires_at = decoded and tonumber(session['expires_at'])
+            if expires_at == nil or expires_at <= now then
+                redis.call('HDEL', hash_name, entry[2])
+            end
+        end
+    end
+    redis.call('ZREM', KEYS[1], member)
+end
+return #members
+"""
+
+# Get cache entry of current version in a single round trip.
+# Entry key is built from version, so the script needs all keys on one node (no cluster).
+# KEYS[1] - version key, ARGV[1] - entry key prefix, ARGV[2] - entry key suffix
+# Returns [version, entry or nil]
+GET_VERSIONED = """
+local version = redis.call('GET', KEYS[1]) or '0'
+return {version, redis.call('GET', ARGV[1] .. version .. ARGV[2])}
+"""
+
+# Delete lock only if it is still held by the caller
+# KEYS[1] - lock key, ARGV[1] - token of the caller
+# Returns 1 if lock is deleted, 0 otherwise
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_client = aioredis.Redis(connection_pool=pool)
+admit_session = _client.register_script(ADMIT_SESSION)
+sweep_sessions = _client.register_script(SWEEP_SESSIONS)
+get_versioned = _client.register_script(GET_VERSIONED)
+release_lock = _client.register_script(RELEASE_LOCK)
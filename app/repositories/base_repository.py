@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
+from collections import defaultdict
 
-from sqlalchemy import select, insert, update, delete
+from sqlalchemy import select, insert, update, delete, values, column, bindparam, any_
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -52,6 +54,33 @@ class Repository(AbstractRepository):
         res = await self.session.execute(stmt)
         return res.scalar_one()
 
+    async def update_returning_previous(self, data: dict, previous: tuple[str, ...] = ()):
+        """
+            Update row in single statement returning it along with values of previous columns before update
+
+            returns: row of (model, *previous values) or None if there is no row with such id
+        """
+        table = self.model.__table__
+        # Snapshot of row before update, locked till the end of transaction
+        old = (select(table.c.id, *(table.c[name] for name in previous))
+               .where(table.c.id == data['id'])
+               .with_for_update()
+               .cte('old'))
+        returning = [old.c[name].label(f'previous_{name}') for name in previous]
+        changes = {key: value for key, value in data.items() if key != 'id'}
+        if changes:
+            stmt = (update(self.model)
+                    .where(self.model.id == old.c.id)
+                    .values(**changes)
+                    .returning(self.model, *returning)
+                    .execution_options(synchronize_session=False, populate_existing=True))
+        else:
+            stmt = (select(self.model, *returning)
+                    .where(self.model.id == old.c.id)
+                    .execution_options(populate_existing=True))
+        res = await self.session.execute(stmt)
+        return res.one_or_none()
+
     async def delete(self, id_):
         stmt = delete(self.model).where(self.model.id == id_).returning(self.model)
         res = await self.session.execute(stmt)
@@ -59,4 +88,66 @@ class Repository(AbstractRepository):
 
     async def get_all(self,*args, **kwargs):
         result = await self.session.execute(select(self.model))
-        return result.scalars().all()
\ No newline at end of file
+        return result.scalars().all()
+
+    def _ids_param(self, ids: list):
+        """Single array parameter for id = ANY(...) condition"""
+        return any_(bindparam('ids', list(ids), type_=ARRAY(self.model.id.type)))
+
+    async def create_many(self, items: list[dict]) -> list:
+        """Insert rows with multi-row INSERT ... RETURNING. Rows are returned in order of items"""
+        if not items:
+            return []
+        stmt = insert(self.model).returning(self.model, sort_by_parameter_order=True)
+        res = await self.session.scalars(stmt, items)
+        return res.all()
+
+    async def update_many(self, items: list[dict], previous: tuple[str, ...] = ()) -> list:
+        """
+            Update rows with UPDATE ... FROM (VALUES ...), one statement per set of updated columns
+
+            items: dicts with 'id' and columns to update
+            previous: columns whose values before update are returned along with updated row
+
+            returns: rows of (model, *previous values) for found ids
+        """
+        table = self.model.__table__
+        groups: dict[tuple[str, ...], list[dict]] = defaultdict(list)
+        for item in items:
+            groups[tuple(sorted(item))].append(item)
+
+        rows = []
+        for keys, group in groups.items():
+            ids = [item['id'] for item in group]
+            # Snapshot of rows before update, locked till the end of transaction
+            old = (select(table.c.id, *(table.c[name] for name in previous))
+                   .where(table.c.id == self._ids_param(ids))
+                   .with_for_update()
+                   .cte('old'))
+            returning = [old.c[name].label(f'previous_{name}') for name in previous]
+            if keys == ('id',):
+                # Nothing to update
+                stmt = (select(self.model, *returning)
+                        .where(self.model.id == old.c.id)
+                        .execution_options(populate_existing=True))
+            else:
+                data = values(*(column(key, table.c[key].type) for key in keys), name='data').data(
+                    [tuple(item[key] for key in keys) for item in group]
+                )
+                stmt = (update(self.model)
+                        .where(self.model.id == data.c.id)
+                        .where(self.model.id == old.c.id)
+                        .values({key: data.c[key] for key in keys if key != 'id'})
+                        .returning(self.model, *returning)
+                        .execution_options(synchronize_session=False, populate_existing=True))
+            res = await self.session.execute(stmt)
+            rows.extend(res.all())
+        return rows
+
+    async def delete_many(self, ids: list) -> list:
+        """Delete rows with DELETE ... WHERE id = ANY(...). Returns deleted rows"""
+        if not ids:
+            return []
+        stmt = delete(self.model).where(self.model.id == self._ids_param(ids)).returning(self.model)
+        res = await self.session.execute(stmt)
+        return res.scalars().all()
\ No newline at end of file
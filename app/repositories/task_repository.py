@@ -1,7 +1,15 @@
-from sqlalchemy import select
-from app.db.models import Task
+import datetime
+from typing import AsyncIterator, Sequence
+from sqlalchemy import Row, Select, select, tuple_
+from app.db.models import Task, User
 from app.repositories.base_repository import Repository
 
+# Columns of task lists. Selecting them instead of entities returns plain rows,
+# so no instances are tracked by session identity map
+TASK_LIST_COLUMNS = (Task.id, Task.name, Task.description, Task.user_id, Task.completed, Task.created_at)
+# Columns of task owners returned along with tasks
+OWNER_COLUMNS = (User.id, User.login, User.name, User.surname, User.roles)
+
 
 class TasksRepository(Repository):
     """
@@ -9,7 +17,52 @@ class TasksRepository(Repository):
     """
     model = Task
 
-    async def get_all(self, user_id) -> list[Task]:
-        """Get user tasks"""
-        tasks = await self.session.execute(select(Task).where(Task.user_id == user_id))
-        return tasks.scalars().all()
+    def _list_query(self, user_id, completed: bool | None) -> Select:
+        stmt = select(*TASK_LIST_COLUMNS).where(Task.user_id == user_id)
+        if completed is not None:
+            stmt = stmt.where(Task.completed == completed)
+        return stmt
+
+    async def get_all(self, user_id, limit: int | None = None, after: tuple[datetime.datetime, int] | None = None,
+                      completed: bool | None = None) -> Sequence[Row]:
+        """
+            Get rows of user tasks ordered by (created_at, id)
+
+            limit: max number of tasks to return
+            after: (created_at, id) of the last task of previous page
+            completed: return only tasks with given completion status
+        """
+        stmt = self._list_query(user_id, completed)
+        if after is not None:
+            stmt = stmt.where(tuple_(Task.created_at, Task.id) > tuple_(*after))
+        stmt = stmt.order_by(Task.created_at, Task.id)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        result = await self.session.execute(stmt)
+        return result.all()
+
+    async def stream_all(self, user_id, completed: bool | None = None,
+                         batch_size: int = 1000) -> AsyncIterator[Sequence[Row]]:
+        """
+            Stream rows of user tasks in batches through server-side cursor,
+            so memory doesn't depend on number of tasks
+        """
+        stmt = self._list_query(user_id, completed)
+        stmt = stmt.order_by(Task.created_at, Task.id).execution_options(yield_per=batch_size)
+        result = await self.session.stream(stmt)
+        async for batch in result.partitions():
+            yield batch
+
+    async def get_owners(self, user_ids) -> Sequence[Row]:
+        """Get rows of task owners by ids in a single query"""
+        stmt = select(*OWNER_COLUMNS).where(User.id == self._ids_param(user_ids))
+        result = await self.session.execute(stmt)
+        return result.all()
+
+    async def get_existing_user_ids(self, user_ids) -> set:
+        """Get which of given user ids exist in a single query"""
+        if not user_ids:
+            return set()
+        stmt = select(User.id).where(User.id == self._ids_param(user_ids))
+        result = await self.session.scalars(stmt)
+        return set(result.all())
@@ -6,10 +6,19 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from redis.asyncio import Redis
 from app.api.schemas.user import UserRegister
 from app.db import operations
-from app.core.security import (hash_password, verify_password, create_access_token, create_fingerprint,
-                               REFRESH_TOKEN_EXPIRATION_TIME, create_refresh_token_uuid, REDIS_USERS_TOKEN_DATA_KEY,
-                               MAX_CONCURRENT_USER_SESSIONS)
+from app.db.redis_scripts import admit_session
+from app.services.user_claims import user_claims_cache
 from app.core.config import settings
+from app.core.security import (hash_password_async, verify_password_async, verify_token_async, create_access_token,
+                               create_fingerprint_async, REFRESH_TOKEN_EXPIRATION_TIME, create_refresh_token_uuid_async,
+                               REDIS_USERS_TOKEN_DATA_KEY, REDIS_USERS_TOKEN_EXPIRY_KEY, MAX_CONCURRENT_USER_SESSIONS)
+
+
+def session_expiry_member(login: str, fingerprint: str) -> str:
+    """Member of sessions expiry set, the same for every renewal of session"""
+    return json.dumps([login, fingerprint])
+
+
 # class AuthService(metaclass=Singleton):
 # We should create new service instance for each request (ain't good solution IMHO)
 class AuthService():
@@ -23,19 +32,27 @@ class AuthService():
     async def set_user_session(self, login: str, user_id: int, fingerprint: str, refresh_token: str,
                                check_session_count=False):
         """Set user session"""
-        # Check if user already has sessions. Limit number is 5
+        # Count check and insert are done by single script, so concurrent logins can't exceed the limit
         hash_name = REDIS_USERS_TOKEN_DATA_KEY + ':' + login
-        if check_session_count and await self._redis.hlen(hash_name) >= MAX_CONCURRENT_USER_SESSIONS:
-            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many login sessions")
-
         created_at = datetime.now(timezone.utc)
+        expires_at = created_at + REFRESH_TOKEN_EXPIRATION_TIME
         user_session_data = {
             'user_id': user_id,
             'refresh_token': refresh_token,
             'expires_in': REFRESH_TOKEN_EXPIRATION_TIME.total_seconds(),
-            'created_at': created_at
+            'created_at': created_at,
+            'expires_at': expires_at.timestamp()
         }
-        await self._redis.hset(hash_name, fingerprint, json.dumps(user_session_data, default=str))
+        max_sessions = MAX_CONCURRENT_USER_SESSIONS if check_session_count else 0
+        admitted = await admit_session(
+            keys=[hash_name, REDIS_USERS_TOKEN_EXPIRY_KEY],
+            args=[fingerprint, json.dumps(user_session_data, default=str), max_sessions,
+                  int(settings.SESSION_EVICT_OLDEST), created_at.timestamp(), expires_at.timestamp(),
+                  session_expiry_member(login, fingerprint), int(REFRESH_TOKEN_EXPIRATION_TIME.total_seconds())],
+            client=self._redis
+        )
+        if not admitted:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many login sessions")
 
     async def validate_refresh_token(self, login: str, fingerprint: str, raw_refresh_token: str) -> str:
         """Validate refresh token from Redis"""
@@ -47,12 +64,16 @@ class AuthService():
         user_session_data = json.loads(user_session_data)
         # Cyphered token
         refresh_token = user_session_data.get('refresh_token')
-        if not verify_password(raw_refresh_token, refresh_token, salt=settings.REFRESH_TOKEN_PASSWORD_SALT):
+        if not raw_refresh_token or not await verify_token_async(raw_refresh_token, refresh_token):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token mismatch")
 
-        expires_in = user_session_data.get('expires_in')
-        created_at = datetime.strptime(user_session_data.get('created_at'), '%Y-%m-%d %H:%M:%S.%f%z').replace(tzinfo=timezone.utc)
-        if (datetime.now(timezone.utc) - created_at).total_seconds() > expires_in:
+        expires_at = user_session_data.get('expires_at')
+        if expires_at is None:
+            # Session stored before expiry time was recorded
+            expires_in = user_session_data.get('expires_in')
+            created_at = datetime.strptime(user_session_data.get('created_at'), '%Y-%m-%d %H:%M:%S.%f%z').replace(tzinfo=timezone.utc)
+            expires_at = created_at.timestamp() + expires_in
+        if datetime.now(timezone.utc).timestamp() > expires_at:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token expired")
 
         return refresh_token
@@ -60,12 +81,16 @@ class AuthService():
     async def delete_session(self, login: str, fingerprint: str):
         """Delete user session"""
         hash_name = REDIS_USERS_TOKEN_DATA_KEY + ':' + login
-        await self._redis.hdel(hash_name, fingerprint)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hdel(hash_name, fingerprint)
+            pipe.zrem(REDIS_USERS_TOKEN_EXPIRY_KEY, session_expiry_member(login, fingerprint))
+            await pipe.execute()
 
     async def register(self, data: UserRegister):
         """Register user method"""
-        data.password = hash_password(data.password)
-        return await operations.create_user(self._session, data)
+        data.password = await hash_password_async(data.password)
+        db_user = await operations.create_user(self._session, data)
+        return db_user
 
     async def get_user(self, id_: int):
         """Get user method"""
@@ -78,21 +103,27 @@ class AuthService():
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User not found")
         # if db_user.logged:
         #     raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User's already been authenticated")
-        if not verify_password(data.password, db_user.password):
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Wrong Password")
+        # Collect user data before ending transaction, since it expires loaded objects
         token_data = {
+            'id': db_user.id,
             'sub': db_user.login,
             'name': db_user.name,
             'surname': db_user.surname,
             'roles': db_user.roles
         }
-        # login_user will commit changes what'll cause session's objects expiration and their attributes'll be loaded from db
-        # again at next invokation to them. Can be circumvented by using Session.expire_on_commit=False
-        await operations.login_user(self._session, db_user.login, db_user)
+        hashed_password, logged = db_user.password, db_user.logged
+        # Return connection to pool while password is verified, nothing is locked or written until it matches
+        await self._session.rollback()
+        if not await verify_password_async(data.password, hashed_password):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Wrong Password")
+        if not logged:
+            await operations.login_user(self._session, data.username)
+        user_claims_cache.set(data.username, token_data)
         access_token = create_access_token(token_data)
-        fingerprint = fingerprint or create_fingerprint(data.username)
-        refresh_token, hashed_refresh_token = create_refresh_token_uuid()
-        await self.set_user_session(data.username, db_user.id, fingerprint, hashed_refresh_token, check_session_count=True)
+        fingerprint = fingerprint or await create_fingerprint_async(data.username)
+        refresh_token, hashed_refresh_token = await create_refresh_token_uuid_async()
+        await self.set_user_session(data.username, token_data['id'], fingerprint, hashed_refresh_token,
+                                    check_session_count=True)
         return (access_token, refresh_token, fingerprint)
 
     async def logout(self, login: str, fingerprint: str):
@@ -103,16 +134,22 @@ class AuthService():
 
     async def reissue_tokens(self, login: str, current_refresh_token: str, fingerprint: str) -> tuple[str, str, str]:
         """Reissue tokens method"""
-        db_user = await operations.get_user_by_login(self._session, login)
-        token_data = {
-            'sub': db_user.login,
-            'name': db_user.name,
-            'surname': db_user.surname,
-            'roles': db_user.roles
-        }
-        access_token = create_access_token(token_data)
         await self.validate_refresh_token(login, fingerprint, current_refresh_token)
+        token_data = user_claims_cache.get(login)
+        if token_data is None:
+            db_user = await operations.get_user_by_login(self._session, login)
+            if db_user is None:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+            token_data = {
+                'id': db_user.id,
+                'sub': db_user.login,
+                'name': db_user.name,
+                'surname': db_user.surname,
+                'roles': db_user.roles
+            }
+            user_claims_cache.set(login, token_data)
+        access_token = create_access_token(token_data)
 
-        refresh_token, hashed_refresh_token = create_refresh_token_uuid()
-        await self.set_user_session(login, db_user.id, fingerprint, hashed_refresh_token)
+        refresh_token, hashed_refresh_token = await create_refresh_token_uuid_async()
+        await self.set_user_session(login, token_data['id'], fingerprint, hashed_refresh_token)
         return (access_token, refresh_token, fingerprint)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from app.core.config import settings
+from app.core.security import REDIS_USERS_TOKEN_DATA_KEY, REDIS_USERS_TOKEN_EXPIRY_KEY, REFRESH_TOKEN_EXPIRATION_TIME
+from app.db.redis_connection import pool
+from app.db.redis_scripts import sweep_sessions
+
+logger = logging.getLogger(__name__)
+
+
+class SessionSweeper:
+    """
+        Background task deleting expired user sessions.
+
+        Every script call checks at most batch_size sessions, so Redis is never blocked for long.
+        Batches follow each other while expired sessions remain, then sweeper sleeps for interval.
+        Session hashes stored before sessions were scheduled for sweeping have no TTL and aren't
+        in expiry set, so on start they are given TTL of refresh token lifetime.
+    """
+    def __init__(self, redis: aioredis.Redis, interval: float = settings.SESSION_SWEEP_INTERVAL,
+                 batch_size: int = settings.SESSION_SWEEP_BATCH_SIZE):
+        self.redis = redis
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Start sweeping in background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop sweeping"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def sweep(self) -> int:
+        """Delete expired sessions batch by batch, return number of processed entries"""
+        total = 0
+        while True:
+            swept = await sweep_sessions(
+                keys=[REDIS_USERS_TOKEN_EXPIRY_KEY],
+                args=[time.time(), self.batch_size, REDIS_USERS_TOKEN_DATA_KEY],
+                client=self.redis
+            )
+            total += swept
+            if swept < self.batch_size:
+                return total
+            # Let other coroutines use connection and event loop between batches
+            await asyncio.sleep(0)
+
+    async def expire_legacy_sessions(self) -> int:
+        """Set TTL of session hashes which have none, return number of updated hashes"""
+        ttl = int(REFRESH_TOKEN_EXPIRATION_TIME.total_seconds())
+        cursor, total = 0, 0
+        while True:
+            cursor, keys = await self.redis.scan(cursor, match=REDIS_USERS_TOKEN_DATA_KEY + ':*',
+                                                 count=self.batch_size, _type='hash')
+            if keys:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        # NX keeps TTL of hashes renewed by logins
+                        pipe.expire(key, ttl, nx=True)
+                    total += sum(await pipe.execute())
+            if cursor == 0:
+                return total
+            await asyncio.sleep(0)
+
+    async def _run(self):
+        try:
+            await self.expire_legacy_sessions()
+        except RedisError as ex:
+            logger.warning("Failed to expire legacy sessions: %r", ex)
+        while True:
+            try:
+                await self.sweep()
+            except RedisError as ex:
+                logger.warning("Failed to sweep expired sessions: %r", ex)
+            await asyncio.sleep(self.interval)
+
+
+session_sweeper = SessionSweeper(aioredis.Redis(connection_pool=pool))
@@ -0,0 +1,183 @@
+"""
+    Redis read-through cache of tasks and per-user task lists
+"""
+import asyncio
+import logging
+import uuid
+from typing import Awaitable, Callable
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from app.api import schemas
+from app.core.config import settings
+from app.db.redis_scripts import get_versioned, release_lock
+
+logger = logging.getLogger(__name__)
+
+TASK_CACHE_KEY = 'task_cache'
+
+
+class TaskCache:
+    """
+        Read-through cache of serialized tasks.
+
+        Single task is stored under key containing version of the task, lists are stored under keys
+        containing version of the user's tasks. Change bumps version with a single INCR, so all
+        of the old entries become unreachable, including ones stored by readers which loaded
+        data before the change and finished after it. Version and entry are read in one round trip.
+        Version keys expire after twice the entry TTL since the last change: by then entries
+        of every older version have expired too, so restarting from version 0 is safe.
+
+        Stampede protection: concurrent misses of the same key are collapsed into one load within
+        worker, and across workers only the holder of Redis lock loads, others wait for its result.
+        Redis errors are logged and never fail request: data is loaded from database instead.
+    """
+    _in_flight: dict[str, asyncio.Future] = {}
+
+    def __init__(self, redis: Redis, ttl: int = settings.TASK_CACHE_TTL,
+                 lock_timeout: float = settings.TASK_CACHE_LOCK_TIMEOUT):
+        self._redis = redis
+        self.ttl = ttl
+        self.version_ttl = 2 * ttl
+        self.lock_timeout = lock_timeout
+
+    @staticmethod
+    def _task_version_key(task_id: int) -> str:
+        return f'{TASK_CACHE_KEY}:task:{task_id}:version'
+
+    @staticmethod
+    def _version_key(user_id: int) -> str:
+        return f'{TASK_CACHE_KEY}:user:{user_id}:version'
+
+    async def get_task(self, task_id: int, loader: Callable[[], Awaitable[schemas.Task]]) -> schemas.Task:
+        """Get task from cache or load it"""
+        raw = await self._get_or_load(self._task_version_key(task_id), f'{TASK_CACHE_KEY}:task:{task_id}:v', '',
+                                      lambda: self._dump_task(loader))
+        return schemas.Task.model_validate_json(raw)
+
+    async def get_user_tasks(self, user_id: int, loader: Callable[[], Awaitable[list[schemas.Task]]],
+                             variant: str = 'all') -> list[schemas.Task]:
+        """Get user's task list from cache or load it. Variant distinguishes lists of the same user"""
+        raw = await self._get_or_load(self._version_key(user_id), f'{TASK_CACHE_KEY}:user:{user_id}:v', f':{variant}',
+                                      lambda: self._dump_tasks(loader))
+        return schemas.task_list_adapter.validate_json(raw)
+
+    async def invalidate_task(self, task_id: int):
+        """Drop cached task"""
+        try:
+            await self._bump_versions([self._task_version_key(task_id)])
+        except RedisError as ex:
+            logger.warning("Failed to invalidate task %s in cache: %r", task_id, ex)
+
+    async def invalidate_many(self, task_ids: list[int], user_ids: list[int]):
+        """Drop cached tasks and all lists of given users in single round trip"""
+        try:
+            await self._bump_versions([self._task_version_key(task_id) for task_id in set(task_ids)]
+                                      + [self._version_key(user_id) for user_id in set(user_ids)])
+        except RedisError as ex:
+            logger.warning("Failed to invalidate tasks in cache: %r", ex)
+
+    async def invalidate_user_tasks(self, user_id: int):
+        """Drop all cached lists of user's tasks"""
+        try:
+            await self._bump_versions([self._version_key(user_id)])
+        except RedisError as ex:
+            logger.warning("Failed to invalidate tasks of user %s in cache: %r", user_id, ex)
+
+    async def _bump_versions(self, version_keys: list[str]):
+        """Increment versions and prolong their keys in single round trip"""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for version_key in version_keys:
+                pipe.incr(version_key)
+                pipe.expire(version_key, self.version_ttl)
+            await pipe.execute()
+
+    @staticmethod
+    async def _dump_task(loader: Callable[[], Awaitable[schemas.Task]]) -> bytes:
+        return (await loader()).model_dump_json().encode()
+
+    @staticmethod
+    async def _dump_tasks(loader: Callable[[], Awaitable[list[schemas.Task]]]) -> bytes:
+        return schemas.task_list_adapter.dump_json(await loader())
+
+    async def _get_or_load(self, version_key: str, prefix: str, suffix: str,
+                           loader: Callable[[], Awaitable[bytes]]) -> bytes:
+        """
+            Return cached value of current version or load it, letting only one loader run per key.
+            Key of value is prefix, version and suffix joined
+        """
+        try:
+            version, cached = await get_versioned(keys=[version_key], args=[prefix, suffix], client=self._redis)
+        except RedisError as ex:
+            logger.warning("Task cache is unavailable: %r", ex)
+            return await loader()
+        if cached is not None:
+            return cached
+
+        key = f'{prefix}{int(version)}{suffix}'
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            await asyncio.wait([in_flight])
+            if in_flight.cancelled():
+                return await loader()
+            return in_flight.result()
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await self._load_locked(key, loader)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as ex:
+            future.set_exception(ex)
+            # Mark exception as retrieved if nobody else waits for it
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def _load_locked(self, key: str, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Load value holding Redis lock, or wait for the worker which holds it"""
+        lock_key, token = key + ':lock', uuid.uuid4().hex
+        try:
+            locked = await self._redis.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000))
+            if not locked:
+                cached = await self._wait_for_holder(key, lock_key)
+                if cached is not None:
+                    return cached
+        except RedisError as ex:
+            logger.warning("Task cache is unavailable: %r", ex)
+            return await loader()
+        if not locked:
+            # Lock holder failed or is too slow: load on our own
+            return await loader()
+
+        try:
+            value = await loader()
+            try:
+                await self._redis.set(key, value, ex=self.ttl)
+            except RedisError as ex:
+                logger.warning("Failed to store %s in task cache: %r", key, ex)
+            return value
+        finally:
+            try:
+                # Release lock only if it's still ours
+                await release_lock(keys=[lock_key], args=[token], client=self._redis)
+            except RedisError as ex:
+                logger.warning("Failed to release task cache lock %s: %r", lock_key, ex)
+
+    async def _wait_for_holder(self, key: str, lock_key: str) -> bytes | None:
+        """Poll for value stored by lock holder until it's stored or lock is released"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_timeout
+        delay = 0.01
+        while loop.time() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.2)
+            async with self._redis.pipeline(transaction=False) as pipe:
+                cached, locked = await pipe.get(key).exists(lock_key).execute()
+            if cached is not None or not locked:
+                return cached
+        return None
@@ -1,16 +1,46 @@
-from fastapi import HTTPException
+import base64
+import binascii
+import datetime
+import json
+from functools import partial
+from typing import AsyncIterator
+from fastapi import HTTPException, status
+from sqlalchemy import Row
+from sqlalchemy.exc import IntegrityError
 from app.api import schemas
+from app.api.schemas.user import User
+from app.core.config import settings
 from app.db import models
+from app.services.task_cache import TaskCache
 from app.utils.unitofwork import IUnitOfWork
 
 
+def encode_task_cursor(task: schemas.Task) -> str:
+    """Encode position after given task into opaque cursor"""
+    raw = json.dumps([task.created_at.isoformat(), task.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_task_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    """Decode cursor into (created_at, id) of the last task of previous page"""
+    try:
+        created_at, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(created_at), int(id_)
+    except (binascii.Error, ValueError, TypeError) as ex:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor") from ex
+
+
 class TaskService:
     """
-        Service class for working with tasks
+        Service class for working with tasks.
+        Reads go through cache if it's given, writes invalidate it
     """
-    def __init__(self, uow: IUnitOfWork):
+    def __init__(self, uow: IUnitOfWork, cache: TaskCache | None = None):
 
         self.uow = uow
+        self.cache = cache
+        # Owners of tasks loaded during request, service lives as long as request does
+        self._users: dict[int, User] = {}
 
     def _get_task_from_db_object(self, task: models.Task) -> schemas.Task:
         """ Get task from db object """
@@ -23,6 +53,31 @@ class TaskService:
             created_at=task.created_at
         )
 
+    @staticmethod
+    def _get_task_from_row(row: Row) -> schemas.Task:
+        """Get task from row of task list columns, read by attributes in pydantic-core"""
+        return schemas.Task.model_validate(row)
+
+    async def _load_users(self, repository, user_ids: set[int]):
+        """Load owners which weren't loaded during this request yet, in a single query"""
+        missing = user_ids.difference(self._users)
+        if missing:
+            for row in await repository.get_owners(missing):
+                self._users[row.id] = User.model_validate(row._asdict())
+
+    def _set_users(self, tasks: list[schemas.Task]):
+        """Set loaded owners of tasks"""
+        for task in tasks:
+            task.user = self._users.get(task.user_id)
+
+    async def _attach_users(self, tasks: list[schemas.Task]):
+        """Set owners of tasks, loading missing ones"""
+        user_ids = {task.user_id for task in tasks}
+        if not user_ids.issubset(self._users):
+            async with self.uow:
+                await self._load_users(self.uow.task, user_ids)
+        self._set_users(tasks)
+
     async def create(self, task: schemas.Task) -> schemas.Task:
         """Create task"""
         db_task = task.model_dump(exclude_none=True)
@@ -30,10 +85,30 @@ class TaskService:
             db_task = await self.uow.task.create(db_task)
             task = self._get_task_from_db_object(db_task)
             await self.uow.commit()
-            return task
+        if self.cache:
+            await self.cache.invalidate_user_tasks(task.user_id)
+        return task
+
+    async def read(self, task_id: int, include_user: bool = False) -> schemas.Task:
+        """Get task by id, with its owner if include_user is set"""
+        if self.cache:
+            task = await self.cache.get_task(task_id, lambda: self._read(task_id))
+        else:
+            task = await self._read(task_id)
+        if include_user:
+            await self._attach_users([task])
+        return task
 
-    async def read(self, task_id: int) -> schemas.Task:
-        """Get task by id"""
+    async def is_owner(self, task_id: int, user_id: int) -> bool:
+        """Whether task exists and belongs to user"""
+        try:
+            task = await self.read(task_id)
+        except HTTPException:
+            return False
+        return task.user_id == user_id
+
+    async def _read(self, task_id: int) -> schemas.Task:
+        """Get task by id from database"""
         async with self.uow:
             db_task = await self.uow.task.read(task_id)
             if db_task is None:
@@ -43,24 +118,177 @@ class TaskService:
 
     async def update(self, task: schemas.Task) -> schemas.Task:
         """Update task"""
+        task, _ = await self.update_with_transition(task)
+        return task
+
+    async def update_with_transition(self, task: schemas.Task) -> tuple[schemas.Task, bool]:
+        """
+            Update task in single statement
+
+            returns: updated task and whether it became completed by this update
+        """
         db_task = task.model_dump(exclude_unset=True, exclude={'user_id', 'user', 'created_at'})
         async with self.uow:
-            db_task = await self.uow.task.update(db_task)
+            row = await self.uow.task.update_returning_previous(db_task, previous=('completed',))
+            if row is None:
+                raise HTTPException(status_code=404, detail=f"Task with id {task.id} not found")
+            db_task, previous_completed = row
             task = self._get_task_from_db_object(db_task)
             await self.uow.commit()
-            return task
+        if self.cache:
+            await self.cache.invalidate_task(task.id)
+            await self.cache.invalidate_user_tasks(task.user_id)
+        return task, bool(task.completed and not previous_completed)
+
+    async def get_all(self, user_id: int, limit: int = settings.TASKS_PAGE_SIZE, cursor: str | None = None,
+                      completed: bool | None = None, include_user: bool = False) -> schemas.TaskPage:
+        """Get page of user's tasks ordered by creation time, with their owners if include_user is set"""
+        after = decode_task_cursor(cursor) if cursor else None
+        limit = min(limit, settings.TASKS_MAX_PAGE_SIZE)
+        # One extra task tells whether there is next page
+        loader = partial(self._get_all, user_id, limit + 1, after, completed)
+        if self.cache:
+            tasks = await self.cache.get_user_tasks(user_id, loader, variant=f'{limit}:{cursor}:{completed}')
+        else:
+            tasks = await loader()
+        next_cursor = None
+        if len(tasks) > limit:
+            tasks = tasks[:limit]
+            next_cursor = encode_task_cursor(tasks[-1])
+        if include_user:
+            await self._attach_users(tasks)
+        return schemas.TaskPage(items=tasks, next_cursor=next_cursor)
 
-    async def get_all(self, user_id: int) -> list[schemas.Task]:
-        """Get task by id"""
+    async def _get_all(self, user_id: int, limit: int, after: tuple[datetime.datetime, int] | None,
+                       completed: bool | None) -> list[schemas.Task]:
+        """Get user's tasks from database"""
         async with self.uow:
-            db_tasks = await self.uow.task.get_all(user_id)
-            return [
-                self._get_task_from_db_object(task)
-                for task in db_tasks
-            ]
+            rows = await self.uow.task.get_all(user_id, limit, after, completed)
+            return schemas.task_list_adapter.validate_python(rows)
+
+    async def export(self, user_id: int, completed: bool | None = None,
+                     include_user: bool = False) -> AsyncIterator[bytes]:
+        """Stream user's tasks as NDJSON, one chunk per batch of rows"""
+        # Stream is consumed after request-scoped unit of work is closed, so it needs its own one
+        uow = self.uow.detached()
+        try:
+            async with uow:
+                async for rows in uow.task.stream_all(user_id, completed, settings.TASKS_EXPORT_BATCH_SIZE):
+                    tasks = [self._get_task_from_row(row) for row in rows]
+                    if include_user:
+                        await self._load_users(uow.task, {task.user_id for task in tasks})
+                        self._set_users(tasks)
+                    yield b''.join(schemas.task_adapter.dump_json(task) + b'\n' for task in tasks)
+        finally:
+            await uow.close()
+
+    async def create_many(self, tasks: list[schemas.Task]) -> list[schemas.TaskBatchResult]:
+        """Create batch of tasks in single transaction"""
+        results: list[schemas.TaskBatchResult | None] = [None] * len(tasks)
+        valid = []
+        for index, task in enumerate(tasks):
+            if task.name is None or task.user_id is None:
+                results[index] = schemas.TaskBatchResult(index=index, status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                                         error="Task name and user_id are required")
+                continue
+            valid.append((index, task))
+
+        async with self.uow:
+            existing_user_ids = await self.uow.task.get_existing_user_ids({task.user_id for _, task in valid})
+            items, indexes = [], []
+            for index, task in valid:
+                if task.user_id not in existing_user_ids:
+                    results[index] = schemas.TaskBatchResult(index=index, status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                                             error=f"User with id {task.user_id} not found")
+                    continue
+                # Same columns in every row, so all of them go into single multi-row INSERT
+                items.append({'name': task.name, 'description': task.description, 'user_id': task.user_id,
+                              'completed': task.completed})
+                indexes.append(index)
+            try:
+                db_tasks = await self.uow.task.create_many(items)
+            except IntegrityError as ex:
+                # User was deleted after the check
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                    detail="Batch rejected: users of tasks were changed, retry request") from ex
+            created = [self._get_task_from_db_object(db_task) for db_task in db_tasks]
+            await self.uow.commit()
+        for index, task in zip(indexes, created):
+            results[index] = schemas.TaskBatchResult(index=index, status=status.HTTP_201_CREATED, id=task.id, task=task)
+        if self.cache:
+            await self.cache.invalidate_many([], [task.user_id for task in created])
+        return results
+
+    async def update_many(self, tasks: list[schemas.Task]) -> tuple[list[schemas.TaskBatchResult], list[schemas.Task]]:
+        """
+            Update batch of tasks in single transaction
+
+            returns: results per item and tasks which became completed by this update
+        """
+        results: list[schemas.TaskBatchResult | None] = [None] * len(tasks)
+        items, indexes, seen_ids = [], [], set()
+        for index, task in enumerate(tasks):
+            if task.id is None or task.id in seen_ids:
+                results[index] = schemas.TaskBatchResult(index=index, id=task.id,
+                                                         status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                                         error="Task id is required and must be unique in batch")
+                continue
+            seen_ids.add(task.id)
+            items.append(task.model_dump(exclude_unset=True, exclude={'user_id', 'user', 'created_at'}))
+            indexes.append(index)
+
+        async with self.uow:
+            rows = await self.uow.task.update_many(items, previous=('completed',))
+            updated = {
+                db_task.id: (self._get_task_from_db_object(db_task), previous_completed)
+                for db_task, previous_completed in rows
+            }
+            await self.uow.commit()
+
+        completed = []
+        for index, item in zip(indexes, items):
+            if item['id'] not in updated:
+                results[index] = schemas.TaskBatchResult(index=index, id=item['id'], status=status.HTTP_404_NOT_FOUND,
+                                                         error=f"Task with id {item['id']} not found")
+                continue
+            task, previous_completed = updated[item['id']]
+            results[index] = schemas.TaskBatchResult(index=index, id=task.id, status=status.HTTP_200_OK, task=task)
+            if task.completed and not previous_completed:
+                completed.append(task)
+        if self.cache:
+            await self.cache.invalidate_many(list(updated), [task.user_id for task, _ in updated.values()])
+        return results, completed
+
+    async def delete_many(self, task_ids: list[int]) -> list[schemas.TaskBatchResult]:
+        """Delete batch of tasks in single transaction"""
+        unique_ids = list(dict.fromkeys(task_ids))
+        async with self.uow:
+            db_tasks = await self.uow.task.delete_many(unique_ids)
+            deleted = {db_task.id: db_task.user_id for db_task in db_tasks}
+            await self.uow.commit()
+        if self.cache:
+            await self.cache.invalidate_many(list(deleted), list(deleted.values()))
+
+        results, seen_ids = [], set()
+        for index, task_id in enumerate(task_ids):
+            if task_id in seen_ids:
+                results.append(schemas.TaskBatchResult(index=index, id=task_id,
+                                                       status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                                       error="Task id must be unique in batch"))
+            elif task_id in deleted:
+                results.append(schemas.TaskBatchResult(index=index, id=task_id, status=status.HTTP_200_OK))
+            else:
+                results.append(schemas.TaskBatchResult(index=index, id=task_id, status=status.HTTP_404_NOT_FOUND,
+                                                       error=f"Task with id {task_id} not found"))
+            seen_ids.add(task_id)
+        return results
 
     async def delete(self, task_id: int):
         """Delete task"""
         async with self.uow:
-            await self.uow.task.delete(task_id)
+            db_task = await self.uow.task.delete(task_id)
+            user_id = db_task.user_id
             await self.uow.commit()
+        if self.cache:
+            await self.cache.invalidate_task(task_id)
+            await self.cache.invalidate_user_tasks(user_id)
@@ -0,0 +1,61 @@
+import json
+import logging
+import time
+import uuid
+from redis.exceptions import RedisError
+from app.core.config import settings
+from app.utils.broadcast import BroadcastBackend, broadcast_backend
+from app.utils.cache import ExpiringLRUCache
+
+logger = logging.getLogger(__name__)
+
+USER_CLAIMS_CHANNEL = 'user_claims_invalidation'
+
+
+class UserClaimsCache:
+    """
+        Per-worker LRU cache of user claims put into access tokens, keyed by login.
+
+        When claim columns of user row change, invalidate must be called: entry is dropped locally and
+        invalidation is published on broadcast backend, so other workers drop it too.
+        Messages carry id of publishing worker, which ignores its own.
+        Entries also expire after ttl, bounding staleness if an invalidation is lost.
+    """
+    def __init__(self, backend: BroadcastBackend, maxsize: int = settings.USER_CLAIMS_CACHE_SIZE,
+                 ttl: float = settings.USER_CLAIMS_CACHE_TTL, channel: str = USER_CLAIMS_CHANNEL):
+        self.backend = backend
+        self.ttl = ttl
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self._cache = ExpiringLRUCache(maxsize)
+        backend.subscribe(channel, self._on_message)
+
+    def get(self, login: str) -> dict | None:
+        """Get copy of cached claims of user, so callers can extend it (e.g. with exp of a token)"""
+        claims = self._cache.get(login)
+        return dict(claims) if claims is not None else None
+
+    def set(self, login: str, claims: dict):
+        """Cache copy of claims of user"""
+        self._cache.set(login, dict(claims), time.time() + self.ttl)
+
+    async def invalidate(self, login: str):
+        """Drop claims of user on all workers"""
+        self._cache.pop(login)
+        try:
+            await self.backend.publish(self.channel, json.dumps({'origin': self.origin, 'login': login}))
+        except RedisError as ex:
+            logger.warning("Failed to publish invalidation of user %s claims: %r", login, ex)
+
+    def _on_message(self, raw_message: str):
+        message = json.loads(raw_message)
+        if message.get('origin') != self.origin:
+            self._cache.pop(message.get('login'))
+
+    @property
+    def stats(self) -> dict:
+        """Cache counters"""
+        return self._cache.stats
+
+
+user_claims_cache = UserClaimsCache(broadcast_backend)
@@ -0,0 +1,123 @@
+"""
+    Broadcast bus delivering messages published by any worker to subscribers of every worker
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Callable
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from app.core.config import settings
+from app.db.redis_connection import pool
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[str], None]
+
+
+class BroadcastBackend(ABC):
+    """Interface for broadcast backend"""
+    def __init__(self):
+        self._handlers: dict[str, list[MessageHandler]] = defaultdict(list)
+
+    def subscribe(self, channel: str, handler: MessageHandler):
+        """Register handler called for every message published to channel"""
+        self._handlers[channel].append(handler)
+
+    def _dispatch(self, channel: str, message: str):
+        """Deliver message to local handlers of channel"""
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(message)
+            except Exception:
+                logger.exception("Broadcast handler failed on channel %s", channel)
+
+    @abstractmethod
+    async def connect(self):
+        ...
+
+    @abstractmethod
+    async def disconnect(self):
+        ...
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str):
+        ...
+
+
+class MemoryBroadcastBackend(BroadcastBackend):
+    """In-process backend. Suitable for single worker and tests"""
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def publish(self, channel: str, message: str):
+        self._dispatch(channel, message)
+
+
+class RedisBroadcastBackend(BroadcastBackend):
+    """
+        Redis pub/sub backend. Every message is published once to Redis,
+        each worker holds single subscription and delivers messages locally
+    """
+    def __init__(self, connection_pool: aioredis.ConnectionPool = pool, reconnect_delay: float = 1.0):
+        super().__init__()
+        self._redis = aioredis.Redis(connection_pool=connection_pool)
+        self._reconnect_delay = reconnect_delay
+        self._listener: asyncio.Task | None = None
+
+    def subscribe(self, channel: str, handler: MessageHandler):
+        is_new_channel = channel not in self._handlers
+        super().subscribe(channel, handler)
+        if is_new_channel and self._listener is not None:
+            # Resubscribe listener to pick up the new channel
+            self._listener.cancel()
+            self._listener = asyncio.create_task(self._listen())
+
+    async def connect(self):
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def disconnect(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def publish(self, channel: str, message: str):
+        await self._redis.publish(channel, message)
+
+    async def _listen(self):
+        """Read messages from subscription, resubscribing on connection errors"""
+        while self._handlers:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(*self._handlers)
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    channel, data = message['channel'], message['data']
+                    self._dispatch(
+                        channel.decode() if isinstance(channel, bytes) else channel,
+                        data.decode() if isinstance(data, bytes) else data
+                    )
+            except (RedisError, OSError) as ex:
+                logger.warning("Broadcast subscription lost: %r. Reconnecting", ex)
+                await asyncio.sleep(self._reconnect_delay)
+            finally:
+                await pubsub.aclose()
+
+
+def create_broadcast_backend(name: str = settings.BROADCAST_BACKEND) -> BroadcastBackend:
+    """Create broadcast backend by its name"""
+    if name == 'redis':
+        return RedisBroadcastBackend()
+    if name == 'memory':
+        return MemoryBroadcastBackend()
+    raise ValueError(f"Unknown broadcast backend: {name}")
+
+
+broadcast_backend = create_broadcast_backend()
@@ -0,0 +1,144 @@
+"""
+    Minimal metrics registry rendered in Prometheus text format.
+
+    Metrics are updated from event loop only, so they are plain counters without locks.
+    Values owned by other components (pool sizes etc.) are read by callbacks at scrape time.
+"""
+import bisect
+import math
+from typing import Callable, Iterable
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base metric with optional labels"""
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def samples(self) -> Iterable[tuple[str, str, float]]:
+        """(suffix, formatted labels, value) of every sample"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(f'{self.name}{suffix}{labels} {_format_value(value)}'
+                     for suffix, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Gauge(Metric):
+    """Value that goes up and down, or is computed by callback at scrape time"""
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 callback: Callable[[], float | dict[tuple, float]] | None = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        # Metric without labels is exposed from the start
+        self._values: dict[tuple, float] = {} if labelnames else {(): 0}
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def inc(self, amount: float = 1, *labels):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, *labels):
+        self.inc(-amount, *labels)
+
+    def samples(self):
+        values = self._values
+        if self.callback is not None:
+            result = self.callback()
+            values = result if isinstance(result, dict) else {(): result}
+        for labels, value in values.items():
+            yield '', _format_labels(self.labelnames, labels), value
+
+
+class Counter(Gauge):
+    """Value that only goes up"""
+    type = 'counter'
+
+
+class Histogram(Metric):
+    """Distribution of observed values over cumulative buckets"""
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (last one is +Inf), sum]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        bounds = self.buckets + (math.inf,)
+        for labels, (counts, total) in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield '_bucket', _format_labels(self.labelnames + ('le',), labels + (_format_value(bound),)), \
+                    cumulative
+            formatted = _format_labels(self.labelnames, labels)
+            yield '_sum', formatted, total
+            yield '_count', formatted, cumulative
+
+
+class Registry:
+    """Collection of metrics exposed together"""
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str):
+        self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route', 'status')))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    'http_requests_in_flight', 'HTTP requests being processed'))
+WS_CONNECTIONS = registry.register(Gauge(
+    'websocket_connections', 'Active websocket connections'))
+BROADCAST_FANOUT = registry.register(Histogram(
+    'websocket_fanout_duration_seconds', 'Time to enqueue a message for its local websocket recipients',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)))
@@ -0,0 +1,97 @@
+"""
+    Token bucket rate limiter shared by all workers through Redis
+"""
+import logging
+import math
+import time
+from dataclasses import dataclass
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from app.utils.cache import ExpiringLRUCache
+
+logger = logging.getLogger(__name__)
+
+# Take one token from bucket refilled continuously at given rate up to its capacity.
+# Time is taken from Redis, so that all workers share the same clock.
+# KEYS[1] - hash holding bucket state
+# ARGV[1] - capacity, ARGV[2] - refill rate (tokens per second)
+# Returns {1, 0} if request is allowed, {0, seconds to wait} otherwise
+TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed, retry_after = 0, (1 - tokens) / rate
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed, retry_after = 1, 0
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+-- Float return values are truncated by Redis, so wait time is returned as string
+return {allowed, tostring(retry_after)}
+"""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Bucket of `capacity` requests refilled over `period` seconds"""
+    capacity: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+
+class LocalRateLimiter:
+    """In-process token buckets, used while Redis is unavailable"""
+    def __init__(self, maxsize: int):
+        self._buckets = ExpiringLRUCache(maxsize)
+
+    def hit(self, key: str, limit: RateLimit) -> tuple[bool, float]:
+        now = time.time()
+        tokens, ts = self._buckets.get(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + max(0.0, now - ts) * limit.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets.set(key, (tokens, now), now + limit.period)
+        return allowed, 0.0 if allowed else (1 - tokens) / limit.rate
+
+
+class RateLimiter:
+    """
+        Redis token bucket limiter: every check is a single atomic script call.
+        If Redis fails, checks go to local buckets for `retry_interval` seconds before Redis is tried again,
+        so that each worker still protects itself and requests don't wait on a dead connection.
+    """
+    def __init__(self, redis: aioredis.Redis, local_maxsize: int = 10000, retry_interval: float = 5.0,
+                 prefix: str = 'rate_limit'):
+        self.redis = redis
+        self.prefix = prefix
+        self.retry_interval = retry_interval
+        self.local = LocalRateLimiter(local_maxsize)
+        self._script = redis.register_script(TOKEN_BUCKET)
+        self._redis_retry_at = 0.0
+
+    async def hit(self, key: str, limit: RateLimit) -> tuple[bool, float]:
+        """Consume one request of key's bucket. Returns whether it's allowed and seconds to wait otherwise"""
+        if time.monotonic() >= self._redis_retry_at:
+            try:
+                allowed, retry_after = await self._script(keys=[f'{self.prefix}:{key}'],
+                                                          args=[limit.capacity, limit.rate])
+                return bool(allowed), float(retry_after)
+            except RedisError as ex:
+                logger.warning("Rate limiter falls back to local buckets: %r", ex)
+                self._redis_retry_at = time.monotonic() + self.retry_interval
+        return self.local.hit(key, limit)
+
+
+def retry_after_header(seconds: float) -> str:
+    """Value of Retry-After header: whole seconds, at least one"""
+    return str(max(1, math.ceil(seconds)))
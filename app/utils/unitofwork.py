@@ -1,4 +1,9 @@
 from abc import ABC, abstractmethod
+from typing import AsyncIterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSessionTransaction
+from sqlalchemy.orm import ORMExecuteState
 
 from app.db.database import async_session_maker
 from app.repositories.base_repository import Repository
@@ -29,24 +34,91 @@ class IUnitOfWork(ABC):
     async def rollback(self):
         ...
 
+    @abstractmethod
+    async def close(self):
+        ...
+
+    @abstractmethod
+    def detached(self) -> 'IUnitOfWork':
+        """New unit of work with its own session, for work outliving the current one"""
+
 
 class UnitOfWork(IUnitOfWork):
-    """Unit of Work implementation"""
-    def __init__(self):
-        self.session_factory = async_session_maker
+    """
+        Unit of Work implementation.
+
+        Session is opened at the first `async with` and is reused by all following ones
+        until close() is called, so a request served by several service calls checks out
+        a single connection. Nested `async with` blocks run inside SAVEPOINTs.
+        Changes of a block exited without commit() are discarded. Transaction which
+        wrote nothing is left open for the next block instead of paying rollback round trip,
+        it's finished once session is closed.
+    """
+    def __init__(self, session_factory=async_session_maker):
+        self.session_factory = session_factory
         self.session = None
+        # One item per entered block: its SAVEPOINT or None for outermost block
+        self._savepoints: list[AsyncSessionTransaction | None] = []
+        # Whether current transaction has written anything
+        self._written = False
 
     async def __aenter__(self):
-        self.session = self.session_factory()
+        if self.session is None:
+            self.session = self.session_factory()
+            self.task = TasksRepository(self.session)
+            event.listen(self.session.sync_session, 'do_orm_execute', self._on_execute)
+            event.listen(self.session.sync_session, 'after_flush', self._on_flush)
+        if self._savepoints and self.session.in_transaction():
+            self._savepoints.append(await self.session.begin_nested())
+        else:
+            self._savepoints.append(None)
+        return self
 
-        self.task = TasksRepository(self.session)
+    async def __aexit__(self, exc_type, *args):
+        savepoint = self._savepoints.pop()
+        if savepoint is not None:
+            # SAVEPOINT is still active if block failed or didn't commit
+            if savepoint.is_active:
+                await savepoint.rollback()
+        elif exc_type is not None or self._written:
+            await self.rollback()
 
-    async def __aexit__(self, *args):
-        await self.rollback()
-        await self.session.close()
+    def _on_execute(self, orm_execute_state: ORMExecuteState):
+        if not orm_execute_state.is_select:
+            self._written = True
+
+    def _on_flush(self, *args):
+        self._written = True
 
     async def commit(self):
-        await self.session.commit()
+        """Commit the innermost block: release its SAVEPOINT or commit transaction"""
+        savepoint = self._savepoints[-1] if self._savepoints else None
+        if savepoint is not None:
+            await savepoint.commit()
+        else:
+            await self.session.commit()
+            self._written = False
 
     async def rollback(self):
-        await self.session.rollback()
\ No newline at end of file
+        await self.session.rollback()
+        self._written = False
+
+    async def close(self):
+        """Close session returning its connection to pool"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self._savepoints.clear()
+        self._written = False
+
+    def detached(self) -> 'UnitOfWork':
+        return UnitOfWork(self.session_factory)
+
+
+async def get_unit_of_work() -> AsyncIterator[UnitOfWork]:
+    """Request-scoped unit of work, shared by all services of request"""
+    uow = UnitOfWork()
+    try:
+        yield uow
+    finally:
+        await uow.close()
@@ -1,25 +1,245 @@
-from fastapi import WebSocket
+import asyncio
+import json
+import logging
+import time
+from fastapi import WebSocket, status
+from redis.exceptions import RedisError
+from app.core.config import settings
+from app.utils.broadcast import BroadcastBackend
+from app.utils.metrics import BROADCAST_FANOUT, WS_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+DROP_MESSAGE_POLICY = 'drop_message'
+DISCONNECT_POLICY = 'disconnect'
+WS_BROADCAST_CHANNEL = 'ws_broadcast'
+
+
+TASK_TOPIC_PREFIX = 'task:'
+
+
+def task_topic(task_id: int) -> str:
+    """Topic of events related to task"""
+    return f'{TASK_TOPIC_PREFIX}{task_id}'
+
+
+def parse_task_topic(topic: str) -> int | None:
+    """Id of task from topic of form task:<id>, None if topic has other form"""
+    if not topic.startswith(TASK_TOPIC_PREFIX):
+        return None
+    task_id = topic[len(TASK_TOPIC_PREFIX):]
+    # 18 digits always fit into BIGINT of tasks.id
+    if not (task_id.isascii() and task_id.isdigit()) or len(task_id) > 18:
+        return None
+    return int(task_id)
+
+
+class Connection:
+    """Websocket connection with its own bounded outbound queue and writer task"""
+    def __init__(self, websocket: WebSocket, queue_size: int, user_id: int | None = None):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.topics: set[str] = set()
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.writer: asyncio.Task | None = None
+        # Number of messages dropped because client didn't keep up
+        self.dropped = 0
+
+    @property
+    def slow(self) -> bool:
+        """Whether client has ever overflowed its queue"""
+        return self.dropped > 0
 
 
 class ConnectionManager:
-    """Manage websocket connections"""
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    """
+        Manage websocket connections.
+
+        Every connection gets a bounded queue drained by a dedicated writer task, so sending
+        never waits on a particular client. A client whose queue is full is handled
+        according to slow consumer policy: either message is dropped for it or it is disconnected.
+
+        Connections are indexed by user and by topic, so targeted messages cost proportionally
+        to the number of recipients, not to the number of all connections.
 
-    async def connect(self, websocket: WebSocket):
-        """Connect to websocket"""
+        If broadcast backend is given, messages are published to it once and delivered to local
+        connections of every worker subscribed to the channel.
+    """
+    def __init__(self, queue_size: int = settings.WS_SEND_QUEUE_SIZE,
+                 send_timeout: float = settings.WS_SEND_TIMEOUT,
+                 slow_consumer_policy: str = settings.WS_SLOW_CONSUMER_POLICY,
+                 max_topics: int = settings.WS_MAX_TOPICS,
+                 backend: BroadcastBackend | None = None,
+                 channel: str = WS_BROADCAST_CHANNEL):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_consumer_policy = slow_consumer_policy
+        self.max_topics = max_topics
+        self.active_connections: dict[WebSocket, Connection] = {}
+        self.user_connections: dict[int, set[WebSocket]] = {}
+        self.topic_connections: dict[str, set[WebSocket]] = {}
+        # Keep references to close tasks of evicted clients, otherwise they can be garbage collected
+        self._closing: set[asyncio.Task] = set()
+        self.backend = backend
+        self.channel = channel
+        if backend is not None:
+            backend.subscribe(channel, self._on_message)
+
+    async def connect(self, websocket: WebSocket, user_id: int | None = None):
+        """Connect to websocket on behalf of user"""
         await websocket.accept()
-        self.active_connections.append(websocket)
+        connection = Connection(websocket, self.queue_size, user_id)
+        connection.writer = asyncio.create_task(self._writer(connection))
+        self.active_connections[websocket] = connection
+        if user_id is not None:
+            self.user_connections.setdefault(user_id, set()).add(websocket)
+        WS_CONNECTIONS.inc()
 
     def disconnect(self, websocket: WebSocket):
         """Disconnect from websocket"""
-        self.active_connections.remove(websocket)
+        connection = self.active_connections.pop(websocket, None)
+        if connection is None:
+            return
+        WS_CONNECTIONS.dec()
+        if connection.user_id is not None:
+            self._discard(self.user_connections, connection.user_id, websocket)
+        for topic in connection.topics:
+            self._discard(self.topic_connections, topic, websocket)
+        if connection.writer and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
+    def subscribe(self, websocket: WebSocket, topic: str) -> bool:
+        """Subscribe websocket to topic. Returns False if connection is gone or has too many topics"""
+        connection = self.active_connections.get(websocket)
+        if connection is None:
+            return False
+        if topic not in connection.topics and len(connection.topics) >= self.max_topics:
+            return False
+        connection.topics.add(topic)
+        self.topic_connections.setdefault(topic, set()).add(websocket)
+        return True
+
+    def unsubscribe(self, websocket: WebSocket, topic: str):
+        """Unsubscribe websocket from topic"""
+        connection = self.active_connections.get(websocket)
+        if connection and topic in connection.topics:
+            connection.topics.discard(topic)
+            self._discard(self.topic_connections, topic, websocket)
+
+    @staticmethod
+    def _discard(index: dict, key, websocket: WebSocket):
+        """Remove websocket from index, dropping empty buckets"""
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.discard(websocket)
+            if not bucket:
+                del index[key]
+
+    async def shutdown(self):
+        """Stop all writer tasks"""
+        writers = [connection.writer for connection in self.active_connections.values() if connection.writer]
+        WS_CONNECTIONS.dec(len(self.active_connections))
+        self.active_connections.clear()
+        self.user_connections.clear()
+        self.topic_connections.clear()
+        for writer in writers:
+            writer.cancel()
+        await asyncio.gather(*writers, *self._closing, return_exceptions=True)
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """Send personal message to websocket"""
-        await websocket.send_text(message)
+        connection = self.active_connections.get(websocket)
+        if connection:
+            self._enqueue(connection, message)
 
     async def broadcast(self, message: str):
-        """Broadcast message to all connected websockets"""
-        for connection in self.active_connections:
-            await connection.send_text(message)
\ No newline at end of file
+        """Broadcast message to all connected websockets of all workers"""
+        await self._publish({'message': message})
+
+    async def notify(self, message: str, users: list[int] = (), topics: list[str] = ()):
+        """Send message to websockets of given users and subscribers of given topics on all workers"""
+        if users or topics:
+            await self._publish({'message': message, 'users': list(users), 'topics': list(topics)})
+
+    async def _publish(self, event: dict):
+        """
+            Publish event to backend or deliver it locally if there is no backend.
+            If backend is unavailable, event reaches local connections only
+        """
+        if self.backend is None:
+            self.deliver_local(event)
+            return
+        try:
+            await self.backend.publish(self.channel, json.dumps(event))
+        except RedisError as ex:
+            logger.warning("Failed to publish websocket event, delivering it locally: %r", ex)
+            self.deliver_local(event)
+
+    def _on_message(self, raw_event: str):
+        """Handle event received from backend"""
+        self.deliver_local(json.loads(raw_event))
+
+    def deliver_local(self, event: dict):
+        """Deliver event to websockets connected to this worker"""
+        start = time.perf_counter()
+        message = event['message']
+        users, topics = event.get('users'), event.get('topics')
+        if users is None and topics is None:
+            # Copy values as slow consumers may be evicted while iterating
+            for connection in list(self.active_connections.values()):
+                self._enqueue(connection, message)
+        else:
+            recipients: set[WebSocket] = set()
+            for user_id in users or ():
+                recipients.update(self.user_connections.get(user_id, ()))
+            for topic in topics or ():
+                recipients.update(self.topic_connections.get(topic, ()))
+            for websocket in recipients:
+                connection = self.active_connections.get(websocket)
+                if connection:
+                    self._enqueue(connection, message)
+        BROADCAST_FANOUT.observe(time.perf_counter() - start)
+
+    def _enqueue(self, connection: Connection, message: str):
+        """Put message to connection queue without waiting"""
+        try:
+            connection.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            connection.dropped += 1
+            if self.slow_consumer_policy == DISCONNECT_POLICY:
+                logger.warning("Websocket client %s is too slow, disconnecting", connection.websocket.client)
+                self._evict(connection)
+            else:
+                logger.warning("Websocket client %s is too slow, message dropped (%s in total)",
+                               connection.websocket.client, connection.dropped)
+
+    def _evict(self, connection: Connection):
+        """Disconnect slow client and close its socket in background"""
+        self.disconnect(connection.websocket)
+        task = asyncio.create_task(self._close(connection.websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, websocket: WebSocket):
+        """Close socket of evicted client"""
+        try:
+            await asyncio.wait_for(websocket.close(code=status.WS_1008_POLICY_VIOLATION), self.send_timeout)
+        except Exception:
+            # Client is gone anyway
+            pass
+
+    async def _writer(self, connection: Connection):
+        """Send queued messages to the client one by one"""
+        try:
+            # Cancellation arriving right as a send completes can be swallowed by wait_for,
+            # so writer also stops once its connection is unregistered
+            while self.active_connections.get(connection.websocket) is connection:
+                message = await connection.queue.get()
+                await asyncio.wait_for(connection.websocket.send_text(message), self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            # Stalled or closed socket: stop serving it
+            logger.info("Websocket client %s dropped: %r", connection.websocket.client, ex)
+            if self.active_connections.get(connection.websocket) is connection:
+                self._evict(connection)
@@ -0,0 +1,4 @@
+"""
+    Benchmarks of the application: load scenarios driving the ASGI app (benchmarks.load)
+    and microbenchmarks of per-request primitives (benchmarks.micro)
+"""
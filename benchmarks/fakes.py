@@ -0,0 +1,125 @@
+"""
+    In-process stand-ins for database layer, so that benchmarks measure application code only
+"""
+import collections
+import datetime
+import itertools
+from typing import AsyncIterator
+from sqlalchemy.orm.exc import NoResultFound
+from app.db import models
+from app.repositories.task_repository import OWNER_COLUMNS, TASK_LIST_COLUMNS
+from app.utils.unitofwork import IUnitOfWork
+
+# Stand-in of rows selected by TasksRepository list queries
+TaskRow = collections.namedtuple('TaskRow', [column.key for column in TASK_LIST_COLUMNS])
+OwnerRow = collections.namedtuple('OwnerRow', [column.key for column in OWNER_COLUMNS])
+
+
+class MemoryTaskStore:
+    """Tasks kept in memory, shared by all units of work of a benchmark run"""
+    def __init__(self):
+        self.tasks: dict[int, models.Task] = {}
+        self._ids = itertools.count(1)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+
+class MemoryTasksRepository:
+    """Task repository over MemoryTaskStore with the same interface as TasksRepository"""
+    def __init__(self, store: MemoryTaskStore):
+        self.store = store
+
+    def _new(self, data: dict) -> models.Task:
+        task = models.Task(**data)
+        task.id = self.store.next_id()
+        task.created_at = task.created_at or datetime.datetime.now(datetime.timezone.utc)
+        self.store.tasks[task.id] = task
+        return task
+
+    async def create(self, data: dict):
+        return self._new(data)
+
+    async def read(self, id_):
+        return self.store.tasks.get(id_)
+
+    async def update(self, data: dict):
+        task = self.store.tasks.get(data['id'])
+        if task is None:
+            raise NoResultFound()
+        for key, value in data.items():
+            setattr(task, key, value)
+        return task
+
+    async def update_returning_previous(self, data: dict, previous: tuple[str, ...] = ()):
+        task = self.store.tasks.get(data['id'])
+        if task is None:
+            return None
+        old = tuple(getattr(task, name) for name in previous)
+        await self.update(data)
+        return (task, *old)
+
+    async def delete(self, id_):
+        task = self.store.tasks.pop(id_, None)
+        if task is None:
+            raise NoResultFound()
+        return task
+
+    async def get_all(self, user_id, limit: int | None = None, after: tuple[datetime.datetime, int] | None = None,
+                      completed: bool | None = None) -> list[TaskRow]:
+        tasks = sorted(
+            (task for task in self.store.tasks.values()
+             if task.user_id == user_id and (completed is None or task.completed == completed)
+             and (after is None or (task.created_at, task.id) > after)),
+            key=lambda task: (task.created_at, task.id)
+        )
+        tasks = tasks[:limit] if limit is not None else tasks
+        return [TaskRow(*(getattr(task, name) for name in TaskRow._fields)) for task in tasks]
+
+    async def stream_all(self, user_id, completed: bool | None = None,
+                         batch_size: int = 1000) -> AsyncIterator[list[TaskRow]]:
+        tasks = await self.get_all(user_id, completed=completed)
+        for start in range(0, len(tasks), batch_size):
+            yield tasks[start:start + batch_size]
+
+    async def get_owners(self, user_ids) -> list[OwnerRow]:
+        # Users aren't stored in fake mode, every referenced one exists
+        return [OwnerRow(user_id, f'user-{user_id}', None, None, None) for user_id in user_ids]
+
+    async def get_existing_user_ids(self, user_ids) -> set:
+        return set(user_ids)
+
+    async def create_many(self, items: list[dict]) -> list:
+        return [self._new(item) for item in items]
+
+    async def update_many(self, items: list[dict], previous: tuple[str, ...] = ()) -> list:
+        rows = [await self.update_returning_previous(item, previous) for item in items]
+        return [row for row in rows if row is not None]
+
+    async def delete_many(self, ids: list) -> list:
+        return [task for task in (self.store.tasks.pop(id_, None) for id_ in ids) if task is not None]
+
+
+class MemoryUnitOfWork(IUnitOfWork):
+    """Unit of work without transactions over MemoryTaskStore"""
+    def __init__(self, store: MemoryTaskStore):
+        self.store = store
+        self.task = MemoryTasksRepository(store)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def detached(self) -> 'MemoryUnitOfWork':
+        return MemoryUnitOfWork(self.store)
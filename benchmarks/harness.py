@@ -0,0 +1,192 @@
+"""
+    Measurement primitives of load benchmarks: latency percentiles, event loop lag,
+    comparison with baseline report and a minimal in-process websocket client for ASGI apps
+"""
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(samples: list[float]) -> dict:
+    """Latency summary in milliseconds"""
+    return {
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'max_ms': round(max(samples, default=0.0) * 1000, 3),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+class LoopLagMonitor:
+    """Measures how late event loop wakes up a task sleeping for fixed interval"""
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def __enter__(self):
+        self.samples.clear()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *args):
+        self._task.cancel()
+
+    def summary(self) -> dict:
+        return summarize(self.samples)
+
+
+@dataclass
+class ScenarioResult:
+    """Result of a single scenario"""
+    name: str
+    operations: int
+    requests: int
+    errors: int
+    duration: float
+    latencies: list[float] = field(repr=False)
+    loop_lag: dict
+
+    def to_dict(self) -> dict:
+        return {
+            'operations': self.operations,
+            'requests': self.requests,
+            'errors': self.errors,
+            'duration_s': round(self.duration, 3),
+            'rps': round(self.requests / self.duration, 1) if self.duration else 0.0,
+            'latency': summarize(self.latencies),
+            'loop_lag': self.loop_lag,
+        }
+
+
+async def run_load(name: str, operation: Callable[[int, int], Awaitable[int]], operations: int,
+                   concurrency: int) -> ScenarioResult:
+    """
+        Run `operations` calls of operation(worker, sequence number) by `concurrency` workers.
+        Operation returns number of requests it made and raises on failure
+    """
+    latencies: list[float] = []
+    counters = {'requests': 0, 'errors': 0}
+    sequence = iter(range(operations))
+
+    async def worker(worker_id: int):
+        for number in sequence:
+            start = time.perf_counter()
+            try:
+                requests = await operation(worker_id, number)
+                counters['requests'] += requests
+            except Exception:
+                counters['errors'] += 1
+            latencies.append(time.perf_counter() - start)
+
+    with LoopLagMonitor() as lag:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(worker_id) for worker_id in range(concurrency)))
+        duration = time.perf_counter() - start
+    return ScenarioResult(name, len(latencies), counters['requests'], counters['errors'], duration, latencies,
+                          lag.summary())
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[dict]:
+    """Scenarios whose p95 latency grew or RPS dropped by more than tolerance relative to baseline"""
+    regressions = []
+    for name, result in report['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        p95, base_p95 = result['latency']['p95_ms'], base['latency']['p95_ms']
+        if base_p95 and p95 > base_p95 * (1 + tolerance):
+            regressions.append({'scenario': name, 'metric': 'p95_ms', 'baseline': base_p95, 'current': p95})
+        if base['rps'] and result['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append({'scenario': name, 'metric': 'rps', 'baseline': base['rps'], 'current': result['rps']})
+    return regressions
+
+
+class ASGIWebSocket:
+    """
+        Websocket client talking to ASGI app in the same event loop
+        (httpx transport doesn't support websockets)
+    """
+    def __init__(self, app, path: str, headers: dict[str, str] | None = None):
+        self.app = app
+        self.scope = {
+            'type': 'websocket',
+            'asgi': {'version': '3.0'},
+            'scheme': 'ws',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+            'subprotocols': [],
+        }
+        self.received: asyncio.Queue[str] = asyncio.Queue()
+        self._incoming: asyncio.Queue[dict] = asyncio.Queue()
+        self._accepted = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def _receive(self) -> dict:
+        return await self._incoming.get()
+
+    async def _send(self, message: dict):
+        if message['type'] == 'websocket.accept':
+            self._accepted.set()
+        elif message['type'] == 'websocket.send':
+            self.received.put_nowait(message.get('text') or message.get('bytes'))
+        elif message['type'] == 'websocket.close':
+            self._accepted.set()
+
+    async def connect(self):
+        self._incoming.put_nowait({'type': 'websocket.connect'})
+        self._task = asyncio.create_task(self.app(self.scope, self._receive, self._send))
+        await self._accepted.wait()
+
+    def send_text(self, text: str):
+        self._incoming.put_nowait({'type': 'websocket.receive', 'text': text})
+
+    async def close(self):
+        self._incoming.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+def environment() -> dict:
+    """Commit and interpreter the report was produced with, so reports are comparable across commits"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform()}
+
+
+def dump(report: dict, path: str | None):
+    """Write report as JSON to file or stdout"""
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
@@ -0,0 +1,241 @@
+"""
+    Load benchmark driving the ASGI app in process through httpx.
+
+    Modes:
+        real - app talks to Postgres and Redis configured for TASK_MANAGER_APP_STAGE (test by default)
+        fake - database is replaced by in-memory unit of work and broadcasts stay in process,
+               so only application code is measured. Auth scenarios need database and are skipped
+
+    Usage:
+        python -m benchmarks.load --mode fake --output report.json
+        python -m benchmarks.load --mode real --baseline report.json --tolerance 0.2
+
+    Report is JSON with p50/p95/p99 latency of operations, requests per second and event loop lag per scenario.
+    With --baseline, scenarios whose p95 grew or RPS dropped by more than tolerance are listed
+    under "regressions" and exit code is 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import uuid
+
+SCENARIOS = ('login', 'reissue_tokens', 'task_crud', 'read_all_large', 'ws_fanout')
+AUTH_SCENARIOS = ('login', 'reissue_tokens')
+PASSWORD = 'bench-password'
+
+
+class LoadBenchmark:
+    """Scenarios run against the app"""
+    def __init__(self, app, client, args: argparse.Namespace):
+        self.app = app
+        self.client = client
+        self.args = args
+        self.fake = args.mode == 'fake'
+        self.run_id = uuid.uuid4().hex[:8]
+        self._fake_user_ids = iter(range(1, 10 ** 9))
+        # Callbacks releasing resources of current scenario
+        self.cleanup = []
+
+    async def _post_ok(self, url: str, **kwargs):
+        response = await self.client.post(url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def login(self, login: str, fingerprint: str) -> dict:
+        """Log user in and return token response"""
+        return await self._post_ok('/auth/login', data={'username': login, 'password': PASSWORD},
+                                   headers={'X-Fingerprint': fingerprint})
+
+    async def create_user(self, name: str) -> tuple[int, str, dict]:
+        """New user: id, login and headers authorizing requests on its behalf"""
+        from app.core.security import create_access_token
+        login = f'bench-{self.run_id}-{name}'
+        if self.fake:
+            user_id = next(self._fake_user_ids)
+            token = create_access_token({'id': user_id, 'sub': login, 'name': None, 'surname': None, 'roles': None})
+            return user_id, login, {'Authorization': 'Bearer ' + token}
+        user = await self._post_ok('/auth/register', data={'login': login, 'name': name, 'surname': name,
+                                                           'password': PASSWORD})
+        tokens = await self.login(login, f'{login}-fingerprint')
+        return user['id'], login, {'Authorization': 'Bearer ' + tokens['access_token']}
+
+    async def scenario_login(self):
+        # One user per worker, fixed fingerprint replaces session instead of hitting sessions limit
+        logins = [(await self.create_user(f'login-{worker}'))[1] for worker in range(self.args.concurrency)]
+
+        async def operation(worker: int, _):
+            await self.login(logins[worker], f'{logins[worker]}-fingerprint')
+            return 1
+        return operation
+
+    async def scenario_reissue_tokens(self):
+        sessions = []
+        for worker in range(self.args.concurrency):
+            _, login, _ = await self.create_user(f'reissue-{worker}')
+            tokens = await self.login(login, f'{login}-fingerprint')
+            sessions.append({'login': login, 'refresh_token': tokens['refresh_token'],
+                             'fingerprint': tokens['fingerprint']})
+
+        async def operation(worker: int, _):
+            session = sessions[worker]
+            tokens = await self._post_ok(f"/auth/reissue-tokens/{session['login']}", headers={
+                'X-Refresh-Token': session['refresh_token'],
+                'X-Fingerprint': session['fingerprint'],
+            })
+            session['refresh_token'] = tokens['refresh_token']
+            return 1
+        return operation
+
+    async def scenario_task_crud(self):
+        users = [await self.create_user(f'crud-{worker}') for worker in range(self.args.concurrency)]
+
+        async def operation(worker: int, number: int):
+            user_id, _, headers = users[worker]
+            task = await self._post_ok('/tasks/create', json={'name': f'task-{number}', 'description': 'bench',
+                                                              'user_id': user_id}, headers=headers)
+            response = await self.client.get(f"/tasks/read/{task['id']}", headers=headers)
+            response.raise_for_status()
+            response = await self.client.put('/tasks/update', json={'id': task['id'], 'completed': True},
+                                             headers=headers)
+            response.raise_for_status()
+            response = await self.client.delete(f"/tasks/delete/{task['id']}", headers=headers)
+            response.raise_for_status()
+            return 4
+        return operation
+
+    async def scenario_read_all_large(self):
+        from app.core.config import settings
+        user_id, _, headers = await self.create_user('large')
+        for start in range(0, self.args.tasks, settings.TASKS_MAX_BATCH_SIZE):
+            batch = [{'name': f'task-{number}', 'description': 'bench', 'user_id': user_id}
+                     for number in range(start, min(start + settings.TASKS_MAX_BATCH_SIZE, self.args.tasks))]
+            await self._post_ok('/tasks/bulk/create', json=batch, headers=headers)
+
+        async def operation(*_):
+            response = await self.client.get(f'/tasks/read-all/{user_id}',
+                                             params={'limit': settings.TASKS_MAX_PAGE_SIZE}, headers=headers)
+            response.raise_for_status()
+            return 1
+        return operation
+
+    async def scenario_ws_fanout(self):
+        from benchmarks.harness import ASGIWebSocket
+        _, _, headers = await self.create_user('ws')
+        clients = [ASGIWebSocket(self.app, f'/ws/init/{number}', headers) for number in range(self.args.ws_clients)]
+        for client in clients:
+            await client.connect()
+        self.cleanup.extend(client.close for client in clients)
+
+        async def wait_for(client: ASGIWebSocket, text: str):
+            while text not in await client.received.get():
+                pass
+
+        async def operation(_, number: int):
+            # Message written by one client is broadcast to everyone, latency is until the last one gets it
+            text = f'bench {number}'
+            clients[0].send_text(text)
+            await asyncio.wait_for(asyncio.gather(*(wait_for(client, 'says: ' + text) for client in clients)),
+                                   timeout=10)
+            return 1
+        return operation
+
+    async def run(self, names: list[str]) -> dict:
+        from benchmarks.harness import run_load
+        results = {}
+        for name in names:
+            if self.fake and name in AUTH_SCENARIOS:
+                continue
+            self.cleanup = []
+            operation = await getattr(self, f'scenario_{name}')()
+            # Fan-out latency is only meaningful for one message at a time
+            concurrency = 1 if name == 'ws_fanout' else self.args.concurrency
+            result = await run_load(name, operation, self.args.operations, concurrency)
+            for close in self.cleanup:
+                await close()
+            results[name] = result.to_dict()
+        return results
+
+
+def configure_environment(mode: str):
+    """Settings overrides, must be applied before app is imported"""
+    os.environ.setdefault('TASK_MANAGER_APP_STAGE', 'test')
+    # Limits and per-request logging would distort measurements
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    os.environ.setdefault('ACCESS_LOG_SAMPLE_RATE', '0')
+    if mode == 'fake':
+        os.environ['BROADCAST_BACKEND'] = 'memory'
+        os.environ['TASK_CACHE_ENABLED'] = 'false'
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import httpx
+    from benchmarks.harness import compare, environment
+    from main import app, lifespan
+    from app.api.endpoints.tasks import ws_manager
+
+    if args.mode == 'fake':
+        from benchmarks.fakes import MemoryTaskStore, MemoryUnitOfWork
+        from app.db.redis import get_redis_async_session
+        from app.utils.unitofwork import get_unit_of_work
+        store = MemoryTaskStore()
+
+        async def get_memory_unit_of_work():
+            yield MemoryUnitOfWork(store)
+
+        async def get_no_redis():
+            yield None
+
+        app.dependency_overrides[get_unit_of_work] = get_memory_unit_of_work
+        app.dependency_overrides[get_redis_async_session] = get_no_redis
+    elif args.create_schema:
+        from app.db.base import Base
+        from app.db.database import engine
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        if args.mode == 'real':
+            async with lifespan(app):
+                scenarios = await LoadBenchmark(app, client, args).run(args.scenarios)
+        else:
+            scenarios = await LoadBenchmark(app, client, args).run(args.scenarios)
+            await ws_manager.shutdown()
+
+    report = {
+        'environment': environment(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'scenarios': scenarios,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            report['regressions'] = compare(report, json.load(file), args.tolerance)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('fake', 'real'), default='fake')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--operations', type=int, default=1000, help='operations per scenario')
+    parser.add_argument('--concurrency', type=int, default=10, help='concurrent clients')
+    parser.add_argument('--tasks', type=int, default=10000, help='tasks of user in read_all_large')
+    parser.add_argument('--ws-clients', type=int, default=100, help='websocket clients in ws_fanout')
+    parser.add_argument('--create-schema', action='store_true', help='create tables before real run')
+    parser.add_argument('--output', help='report file, stdout by default')
+    parser.add_argument('--baseline', help='report to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args()
+
+    configure_environment(args.mode)
+    from benchmarks.harness import dump
+    report = asyncio.run(run(args))
+    dump(report, args.output)
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+    Microbenchmarks of per-request primitives: tokens, password and token hashing,
+    conversion of task rows and FastAPI response serialization of task lists.
+
+    Usage:
+        python -m benchmarks.micro --output micro.json
+        python -m benchmarks.micro --sizes 10 1000 --repeat 3
+
+    Every benchmark is timed `repeat` times over a number of calls chosen to run for about --min-time seconds.
+    Report has median and best time per call in microseconds, together with commit it was measured at.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import statistics
+import time
+from typing import Callable
+
+DEFAULT_SIZES = (10, 1000, 50000)
+
+
+def measure(func: Callable[[], object], repeat: int, min_time: float) -> dict:
+    """Time func: calibrate number of calls per round, then take `repeat` rounds"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    rounds = [elapsed]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append(time.perf_counter() - start)
+    per_call = [duration / number * 1_000_000 for duration in rounds]
+    return {
+        'median_us': round(statistics.median(per_call), 3),
+        'best_us': round(min(per_call), 3),
+        'calls_per_round': number,
+        'rounds': repeat,
+    }
+
+
+def make_tasks(count: int) -> list:
+    """Task rows as returned by repository"""
+    from app.db import models
+    created_at = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    return [
+        models.Task(id=number, name=f'task-{number}', description=f'description of task {number}', user_id=1,
+                    completed=number % 2 == 0, created_at=created_at + datetime.timedelta(seconds=number))
+        for number in range(count)
+    ]
+
+
+def security_benchmarks(args: argparse.Namespace) -> dict:
+    from app.core import security
+    claims = {'id': 1, 'sub': 'bench-user', 'name': 'name', 'surname': 'surname', 'roles': None}
+    token = security.create_access_token(claims)
+    hashed_password = security.hash_password('bench-password')
+
+    def get_user_from_token_uncached():
+        security.access_token_cache.pop(token)
+        security.get_user_from_token(token)
+
+    benchmarks = {
+        'create_access_token': lambda: security.create_access_token(claims),
+        'get_user_from_token.uncached': get_user_from_token_uncached,
+        'get_user_from_token.cached': lambda: security.get_user_from_token(token),
+        'create_refresh_token_uuid': security.create_refresh_token_uuid,
+        'create_fingerprint': lambda: security.create_fingerprint('bench-user'),
+        # bcrypt is slow by design, a single call per round is enough
+        'hash_password': lambda: security.hash_password('bench-password'),
+        'verify_password': lambda: security.verify_password('bench-password', hashed_password),
+    }
+    results = {}
+    for name, func in benchmarks.items():
+        min_time = 0 if name in ('hash_password', 'verify_password') else args.min_time
+        results[name] = measure(func, args.repeat, min_time)
+    return results
+
+
+def serialization_benchmarks(args: argparse.Namespace) -> dict:
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+    from app.api import schemas
+    from app.services.task_service import TaskService
+    from benchmarks.fakes import TaskRow
+
+    service = TaskService(uow=None)
+    # The same field FastAPI builds for endpoint annotated with -> list[schemas.Task]
+    response_field = create_model_field('Response_bench', list[schemas.Task], mode='serialization')
+    loop = asyncio.new_event_loop()
+
+    def render(tasks: list):
+        content = loop.run_until_complete(serialize_response(field=response_field, response_content=tasks))
+        return JSONResponse(content).body
+
+    results = {}
+    for size in args.sizes:
+        rows = make_tasks(size)
+        tasks = [service._get_task_from_db_object(row) for row in rows]
+        results[f'get_task_from_db_object[{size}]'] = measure(
+            lambda: [service._get_task_from_db_object(row) for row in rows],
+            args.repeat, args.min_time)
+        # Column rows read by list endpoints
+        column_rows = [TaskRow(*(getattr(row, name) for name in TaskRow._fields)) for row in rows]
+        results[f'get_task_from_row[{size}]'] = measure(
+            lambda: [service._get_task_from_row(row) for row in column_rows],
+            args.repeat, args.min_time)
+        results[f'serialize_response[{size}]'] = measure(lambda: render(tasks), args.repeat, args.min_time)
+        # Fast path of task endpoints
+        results[f'task_list_adapter.dump_json[{size}]'] = measure(
+            lambda: schemas.task_list_adapter.dump_json(tasks), args.repeat, args.min_time)
+    loop.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='numbers of tasks')
+    parser.add_argument('--repeat', type=int, default=5, help='rounds per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimal duration of a round, seconds')
+    parser.add_argument('--output', help='report file, stdout by default')
+    args = parser.parse_args()
+
+    os.environ.setdefault('TASK_MANAGER_APP_STAGE', 'test')
+    # Importing app first resolves import order of its modules
+    import main as _
+    from benchmarks.harness import dump, environment
+    report = {
+        'environment': environment(),
+        'config': {'sizes': args.sizes, 'repeat': args.repeat, 'min_time': args.min_time},
+        'results': {**security_benchmarks(args), **serialization_benchmarks(args)},
+    }
+    dump(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
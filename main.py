@@ -1,15 +1,33 @@
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
 from redis.exceptions import RedisClusterException, RedisError
 from app.api.endpoints.users import auth_router
-from app.api.endpoints.tasks import tasks_router, websocket_router
+from app.api.endpoints.tasks import tasks_router, websocket_router, ws_manager
 from app.api.endpoints.checks import check_router
 from app.api.endpoints.errors.handlers import user_registration_error_handler, redis_error_handler
 from app.api.endpoints.errors.models import UserRegistrationError
-from app.api.middleware import logging_middleware
+from app.api.middleware import logging_middleware, rate_limit_middleware, start_access_log, stop_access_log
+from app.utils.broadcast import broadcast_backend
+from app.core.security import crypto_pool
+from app.services.session_sweeper import session_sweeper
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """Start and stop background workers of application"""
+    start_access_log()
+    await broadcast_backend.connect()
+    session_sweeper.start()
+    yield
+    await session_sweeper.stop()
+    await broadcast_backend.disconnect()
+    await ws_manager.shutdown()
+    crypto_pool.shutdown()
+    stop_access_log()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_exception_handler(UserRegistrationError, handler=user_registration_error_handler)
 app.add_exception_handler(RedisError, handler=redis_error_handler)
@@ -20,6 +38,8 @@ app.include_router(tasks_router)
 app.include_router(websocket_router)
 app.include_router(check_router)
 
+# The last added middleware runs first, so rejected requests are logged too
+app.middleware("http")(rate_limit_middleware)
 app.middleware("http")(logging_middleware)
 
 # Comment/uncomment depending on running in Docker or not
@@ -58,6 +58,13 @@ async def get_redis_async_session_override() -> AsyncIterator[Redis]:
     await redis.aclose()
 
 
+@pytest_asyncio.fixture(name="redis")
+async def redis_fixture() -> AsyncGenerator[Redis, None]:
+    """Redis client configured like the one injected into endpoints"""
+    async for redis in get_redis_async_session_override():
+        yield redis
+
+
 app.dependency_overrides[get_async_session] = get_async_session_override
 app.dependency_overrides[get_redis_async_session] = get_redis_async_session_override
 client = TestClient(app)
@@ -0,0 +1,50 @@
+import json
+import logging
+import pytest
+from httpx import AsyncClient
+from app.api import middleware
+from app.core.config import settings
+
+
+@pytest.fixture(name='access_log')
+def access_log_fixture(caplog, monkeypatch) -> pytest.LogCaptureFixture:
+    """Capture of access log. Access logger doesn't propagate, so it's enabled for caplog"""
+    monkeypatch.setattr(settings, 'RATE_LIMIT_ENABLED', False)
+    monkeypatch.setattr(middleware.logger, 'propagate', True)
+    caplog.set_level(logging.INFO, logger=middleware.logger.name)
+    return caplog
+
+
+def access_entries(records: list[logging.LogRecord]) -> list[dict]:
+    """Access log records rendered by access log formatter"""
+    formatter = middleware.JsonFormatter()
+    return [json.loads(formatter.format(record)) for record in records if record.name == middleware.logger.name]
+
+
+class TestAccessLog:
+    """Test access log middleware"""
+
+    @pytest.mark.asyncio
+    async def test_single_record_per_request(self, async_client: AsyncClient, access_log, monkeypatch):
+        """Test every request is logged once as JSON with template of its route"""
+        monkeypatch.setattr(settings, 'ACCESS_LOG_SAMPLE_RATE', 1)
+        await async_client.get("/checks/health")
+        response = await async_client.get("/tasks/read/5")
+        assert response.status_code == 401
+        entries = access_entries(access_log.records)
+        assert [(entry['route'], entry['path'], entry['status']) for entry in entries] == [
+            ('/checks/health', '/checks/health', 200),
+            ('/tasks/read/{id_}', '/tasks/read/5', 401),
+        ]
+        assert all(entry['method'] == 'GET' and entry['duration_ms'] >= 0 for entry in entries)
+
+    @pytest.mark.asyncio
+    async def test_successful_requests_sampled(self, async_client: AsyncClient, access_log, monkeypatch):
+        """Test successful requests aren't logged at sample rate 0, errors still are"""
+        monkeypatch.setattr(settings, 'ACCESS_LOG_SAMPLE_RATE', 0)
+        for _ in range(5):
+            await async_client.get("/checks/health")
+        await async_client.get("/tasks/read/5")
+        await async_client.get("/unknown-path")
+        entries = access_entries(access_log.records)
+        assert [(entry['route'], entry['status']) for entry in entries] == [('/tasks/read/{id_}', 401), (None, 404)]
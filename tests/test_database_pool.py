@@ -0,0 +1,29 @@
+import pytest
+from httpx import AsyncClient
+from app.core.config import settings
+from app.db.database import InstrumentedQueuePool, engine, get_pool_stats
+
+
+class TestDatabasePool:
+    """Test database connection pool settings and stats"""
+
+    def test_pool_configured_from_settings(self):
+        """Test application engine uses instrumented pool sized by settings"""
+        pool = engine.sync_engine.pool
+        assert isinstance(pool, InstrumentedQueuePool)
+        assert pool.timeout() == settings.DB_POOL_TIMEOUT
+        stats = get_pool_stats()
+        assert stats['size'] == settings.DB_POOL_SIZE
+        assert stats['max_overflow'] == settings.DB_MAX_OVERFLOW
+
+    @pytest.mark.asyncio
+    async def test_pool_stats_endpoint(self, async_client: AsyncClient, monkeypatch):
+        """Test pool stats endpoint returns usage and checkout wait time"""
+        monkeypatch.setattr(settings, 'RATE_LIMIT_ENABLED', False)
+        response = await async_client.get("/checks/db-pool")
+        assert response.status_code == 200
+        stats = response.json()
+        assert stats['size'] == settings.DB_POOL_SIZE
+        assert stats['max_overflow'] == settings.DB_MAX_OVERFLOW
+        assert {'checked_in', 'checked_out', 'overflow', 'saturation',
+                'checkouts', 'timeouts', 'wait_time_total', 'wait_time_max', 'wait_time_avg'} <= stats.keys()
@@ -1,11 +1,26 @@
+import json
+from datetime import datetime, timedelta, timezone
 import pytest
 from httpx import AsyncClient
+from redis.asyncio import Redis
+from sqlalchemy import select
 from app.api import schemas
+from app.core.config import settings
+from app.core.security import MAX_CONCURRENT_USER_SESSIONS, REDIS_USERS_TOKEN_DATA_KEY
+from app.db import models
+from app.services.user_claims import user_claims_cache
+from tests.conftest import async_session_maker
 
 REFRESH_TOKEN_HEADER = 'X-Refresh-Token'
 FINGERPRINT_HEADER = 'X-Fingerprint'
 
 
+@pytest.fixture(autouse=True)
+def disable_rate_limit(monkeypatch):
+    """Tests register and log in more often than auth rate limits allow"""
+    monkeypatch.setattr(settings, 'RATE_LIMIT_ENABLED', False)
+
+
 class TestUserEndpoints:
     """Test user endpoints"""
 
@@ -57,6 +72,53 @@ class TestUserEndpoints:
             'status': 'logged out'
         }
 
+    @pytest.mark.asyncio
+    async def test_login_with_wrong_password(self, async_client: AsyncClient):
+        """Test wrong password is rejected without marking user as logged"""
+        login = 'test-wrong-password-user'
+        response = await async_client.post("/auth/register", data={
+            "login": login,
+            "name": self.user_name,
+            "surname": self.user_surname,
+            "password": self.user_password
+            })
+        assert response.status_code == 200
+        response = await async_client.post("/auth/login", data={
+            "username": login,
+            "password": self.user_password + '-wrong'
+            })
+        assert response.status_code == 401
+        async with async_session_maker() as session:
+            logged = await session.scalar(select(models.User.logged).where(models.User.login == login))
+        assert not logged
+
+    @pytest.mark.asyncio
+    async def test_cached_claims_unchanged_by_tokens(self, async_client: AsyncClient):
+        """Test issuing tokens doesn't change claims cached for the user"""
+        login = 'test-claims-user'
+        response = await async_client.post("/auth/register", data={
+            "login": login,
+            "name": self.user_name,
+            "surname": self.user_surname,
+            "password": self.user_password
+            })
+        assert response.status_code == 200
+        claims = {'id': response.json()['id'], 'sub': login, 'name': self.user_name,
+                  'surname': self.user_surname, 'roles': None}
+        response = await async_client.post("/auth/login", data={
+            "username": login,
+            "password": self.user_password
+            })
+        assert response.status_code == 200
+        tokens = response.json()
+        assert user_claims_cache.get(login) == claims
+        response = await async_client.post(f"/auth/reissue-tokens/{login}", headers={
+            REFRESH_TOKEN_HEADER: tokens['refresh_token'],
+            FINGERPRINT_HEADER: tokens['fingerprint']
+        })
+        assert response.status_code == 200
+        assert user_claims_cache.get(login) == claims
+
 
 class TestTaskEndpoints:
     """Test task endpoints"""
@@ -131,6 +193,10 @@ class TestTaskEndpoints:
         response = await async_client.put("/tasks/update", json=task.model_dump(exclude={'created_at'}),
                                           headers=headers)
         assert response.status_code == 200
+        assert response.json()['completed'] is True
+        # 3.1 Update task which doesn't exist
+        response = await async_client.put("/tasks/update", json={'id': -1, 'completed': True}, headers=headers)
+        assert response.status_code == 404
         # 4. Read task to check updates
         response = await async_client.get(f"/tasks/read/{task.id}", headers=headers)
         assert response.status_code == 200
@@ -152,6 +218,37 @@ class TestTaskEndpoints:
         assert len(tasks) == 2
         assert task.id == tasks[0]['id']
         assert task2.id == tasks[1]['id']
+        assert 'X-Next-Cursor' not in response.headers
+        # 6.1 Get tasks page by page
+        response = await async_client.get(f"/tasks/read-all/{user_id}", params={'limit': 1}, headers=headers)
+        assert response.status_code == 200
+        assert [t['id'] for t in response.json()] == [task.id]
+        cursor = response.headers['X-Next-Cursor']
+        response = await async_client.get(f"/tasks/read-all/{user_id}", params={'limit': 1, 'cursor': cursor},
+                                          headers=headers)
+        assert response.status_code == 200
+        assert [t['id'] for t in response.json()] == [task2.id]
+        assert 'X-Next-Cursor' not in response.headers
+        # 6.2 Get only completed tasks
+        response = await async_client.get(f"/tasks/read-all/{user_id}", params={'completed': True}, headers=headers)
+        assert response.status_code == 200
+        assert [t['id'] for t in response.json()] == [task.id]
+        # 6.3 Get tasks with their owner
+        response = await async_client.get(f"/tasks/read-all/{user_id}", params={'include': 'user'}, headers=headers)
+        assert response.status_code == 200
+        owners = [t['user'] for t in response.json()]
+        assert len(owners) == 2
+        assert all(owner == {'id': user_id, 'login': self.user_login, 'name': self.user_name,
+                             'surname': self.user_surname, 'roles': None} for owner in owners)
+        response = await async_client.get(f"/tasks/read/{task.id}", params={'include': 'user'}, headers=headers)
+        assert response.status_code == 200
+        assert response.json()['user']['login'] == self.user_login
+        # 6.4 Export tasks as NDJSON
+        response = await async_client.get(f"/tasks/export/{user_id}", headers=headers)
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        exported = [schemas.Task.model_validate_json(line) for line in response.text.splitlines()]
+        assert [t.id for t in exported] == [task.id, task2.id]
         # 7. Delete first task
         response = await async_client.delete(f"/tasks/delete/{task.id}", headers=headers)
         assert response.status_code == 200
@@ -173,3 +270,180 @@ class TestTaskEndpoints:
             FINGERPRINT_HEADER: login_response_data['fingerprint']
         })
         assert response.status_code == 401
+
+    @pytest.mark.asyncio
+    async def test_bulk_task_operations(self, async_client: AsyncClient):
+        """Test batch creation, update and deletion of tasks"""
+        # 0. Register and login user
+        login = self.user_login + '-bulk'
+        response = await async_client.post("/auth/register", data={
+            "login": login,
+            "name": self.user_name,
+            "surname": self.user_surname,
+            "password": self.user_password
+            })
+        assert response.status_code == 200
+        user_id = response.json()['id']
+        response = await async_client.post("/auth/login", data={
+            "username": login,
+            "password": self.user_password
+            })
+        assert response.status_code == 200
+        headers = {'Authorization': 'Bearer ' + response.json()['access_token']}
+        # 1. Create batch, one item is invalid, another one refers to missing user
+        tasks = [
+            schemas.Task(name=name, description=description, user_id=user_id).model_dump()
+            for name, description in zip(self.task_names, self.task_descriptions)
+        ]
+        tasks.append(schemas.Task(description='no name', user_id=user_id).model_dump())
+        tasks.append(schemas.Task(name='no user', user_id=-1).model_dump())
+        response = await async_client.post("/tasks/bulk/create", json=tasks, headers=headers)
+        assert response.status_code == 200
+        results = response.json()
+        assert [result['status'] for result in results] == [201, 201, 201, 422, 422]
+        assert results[4]['error'] == "User with id -1 not found"
+        assert [result['task']['name'] for result in results[:3]] == self.task_names
+        ids = [result['id'] for result in results[:3]]
+        # 2. Update batch, one task doesn't exist
+        response = await async_client.put("/tasks/bulk/update", json=[
+            {'id': ids[0], 'completed': True},
+            {'id': ids[1], 'description': 'updated'},
+            {'id': -1, 'completed': True},
+        ], headers=headers)
+        assert response.status_code == 200
+        results = response.json()
+        assert [result['status'] for result in results] == [200, 200, 404]
+        assert results[0]['task']['completed'] is True
+        assert results[1]['task']['description'] == 'updated'
+        assert results[1]['task']['name'] == self.task_names[1]
+        # 3. Delete batch, one task doesn't exist, another one is repeated
+        response = await async_client.post("/tasks/bulk/delete", json=[ids[0], ids[1], ids[1], -1], headers=headers)
+        assert response.status_code == 200
+        assert [result['status'] for result in response.json()] == [200, 200, 422, 404]
+        response = await async_client.get(f"/tasks/read-all/{user_id}", headers=headers)
+        assert [task['id'] for task in response.json()] == [ids[2]]
+
+
+class TestSessionEndpoints:
+    """Test limit of concurrent login sessions"""
+
+    user_name = 'test-name3'
+    user_surname = 'test-surname3'
+    user_password = 'test-password3'
+
+    @pytest.mark.asyncio
+    async def test_login_over_limit_rejected(self, async_client: AsyncClient, redis: Redis):
+        """Test login with new fingerprint is rejected when user has max number of sessions"""
+        # 0. Register user
+        login = 'test-sessions-limit'
+        response = await async_client.post("/auth/register", data={
+            "login": login,
+            "name": self.user_name,
+            "surname": self.user_surname,
+            "password": self.user_password
+            })
+        assert response.status_code == 200
+        # 1. Login from max number of clients
+        for number in range(MAX_CONCURRENT_USER_SESSIONS):
+            response = await async_client.post("/auth/login", data={
+                "username": login,
+                "password": self.user_password
+                }, headers={FINGERPRINT_HEADER: f'fingerprint-{number}'})
+            assert response.status_code == 200
+        # 2. Login from one more client
+        response = await async_client.post("/auth/login", data={
+            "username": login,
+            "password": self.user_password
+            }, headers={FINGERPRINT_HEADER: 'fingerprint-new'})
+        assert response.status_code == 429
+        sessions = await redis.hkeys(f'{REDIS_USERS_TOKEN_DATA_KEY}:{login}')
+        assert sorted(sessions) == [f'fingerprint-{number}' for number in range(MAX_CONCURRENT_USER_SESSIONS)]
+
+    @pytest.mark.asyncio
+    async def test_login_with_same_fingerprint_replaces_session(self, async_client: AsyncClient, redis: Redis):
+        """Test repeated login from the same client replaces its session instead of taking a new slot"""
+        # 0. Register user
+        login = 'test-sessions-replace'
+        response = await async_client.post("/auth/register", data={
+            "login": login,
+            "name": self.user_name,
+            "surname": self.user_surname,
+            "password": self.user_password
+            })
+        assert response.status_code == 200
+        hash_name = f'{REDIS_USERS_TOKEN_DATA_KEY}:{login}'
+        # 1. Login from max number of clients
+        for number in range(MAX_CONCURRENT_USER_SESSIONS):
+            response = await async_client.post("/auth/login", data={
+                "username": login,
+                "password": self.user_password
+                }, headers={FINGERPRINT_HEADER: f'fingerprint-{number}'})
+            assert response.status_code == 200
+        previous = await redis.hget(hash_name, 'fingerprint-0')
+        # 2. Login again from the first client
+        response = await async_client.post("/auth/login", data={
+            "username": login,
+            "password": self.user_password
+            }, headers={FINGERPRINT_HEADER: 'fingerprint-0'})
+        assert response.status_code == 200
+        assert await redis.hlen(hash_name) == MAX_CONCURRENT_USER_SESSIONS
+        assert await redis.hget(hash_name, 'fingerprint-0') != previous
+
+    @pytest.mark.asyncio
+    async def test_oldest_session_evicted(self, async_client: AsyncClient, redis: Redis, monkeypatch):
+        """Test the oldest session gives place to a new one when eviction is enabled"""
+        monkeypatch.setattr(settings, 'SESSION_EVICT_OLDEST', True)
+        # 0. Register user
+        login = 'test-sessions-evict'
+        response = await async_client.post("/auth/register", data={
+            "login": login,
+            "name": self.user_name,
+            "surname": self.user_surname,
+            "password": self.user_password
+            })
+        assert response.status_code == 200
+        # 1. Login from max number of clients and one more
+        fingerprints = [f'fingerprint-{number}' for number in range(MAX_CONCURRENT_USER_SESSIONS)] + ['fingerprint-new']
+        for fingerprint in fingerprints:
+            response = await async_client.post("/auth/login", data={
+                "username": login,
+                "password": self.user_password
+                }, headers={FINGERPRINT_HEADER: fingerprint})
+            assert response.status_code == 200
+        sessions = await redis.hkeys(f'{REDIS_USERS_TOKEN_DATA_KEY}:{login}')
+        assert len(sessions) == MAX_CONCURRENT_USER_SESSIONS
+        assert 'fingerprint-0' not in sessions
+        assert 'fingerprint-new' in sessions
+
+    @pytest.mark.asyncio
+    async def test_expired_sessions_pruned_before_count(self, async_client: AsyncClient, redis: Redis):
+        """Test expired sessions don't count against the limit"""
+        # 0. Register user with an expired session
+        login = 'test-sessions-expired'
+        response = await async_client.post("/auth/register", data={
+            "login": login,
+            "name": self.user_name,
+            "surname": self.user_surname,
+            "password": self.user_password
+            })
+        assert response.status_code == 200
+        hash_name = f'{REDIS_USERS_TOKEN_DATA_KEY}:{login}'
+        expired_at = datetime.now(timezone.utc) - timedelta(days=1)
+        await redis.hset(hash_name, 'fingerprint-expired', json.dumps({
+            'user_id': response.json()['id'],
+            'refresh_token': 'expired',
+            'created_at': str(expired_at - timedelta(days=1)),
+            'expires_at': expired_at.timestamp()
+        }))
+        # 1. Login from max number of clients
+        fingerprints = [f'fingerprint-{number}' for number in range(MAX_CONCURRENT_USER_SESSIONS - 1)]
+        fingerprints.append('fingerprint-new')
+        for fingerprint in fingerprints:
+            response = await async_client.post("/auth/login", data={
+                "username": login,
+                "password": self.user_password
+                }, headers={FINGERPRINT_HEADER: fingerprint})
+            assert response.status_code == 200
+        sessions = await redis.hkeys(hash_name)
+        assert len(sessions) == MAX_CONCURRENT_USER_SESSIONS
+        assert 'fingerprint-expired' not in sessions
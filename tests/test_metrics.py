@@ -0,0 +1,61 @@
+import re
+from app.core.config import settings
+from app.utils.metrics import CONTENT_TYPE, Counter, Gauge, Histogram, Registry
+from tests.conftest import client
+
+
+class TestMetrics:
+    """Test metrics registry"""
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test histogram renders cumulative buckets, sum and count per label set"""
+        registry = Registry()
+        histogram = registry.register(Histogram('latency', 'Latency', ('route',), buckets=(0.1, 1.0)))
+        histogram.observe(0.05, '/a')
+        histogram.observe(0.1, '/a')
+        histogram.observe(5, '/a')
+        lines = registry.render().splitlines()
+        assert 'latency_bucket{route="/a",le="0.1"} 2' in lines
+        assert 'latency_bucket{route="/a",le="1.0"} 2' in lines
+        assert 'latency_bucket{route="/a",le="+Inf"} 3' in lines
+        assert 'latency_sum{route="/a"} 5.15' in lines
+        assert 'latency_count{route="/a"} 3' in lines
+
+    def test_gauges(self):
+        """Test plain gauge, callback gauge with labels and counter"""
+        registry = Registry()
+        gauge = registry.register(Gauge('in_flight', 'In flight'))
+        registry.register(Gauge('pool', 'Pool', ('state',), callback=lambda: {('idle',): 2, ('used',): 3}))
+        registry.register(Counter('timeouts_total', 'Timeouts', callback=lambda: 7))
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        text = registry.render()
+        assert '# TYPE in_flight gauge\nin_flight 1\n' in text
+        assert 'pool{state="idle"} 2\npool{state="used"} 3\n' in text
+        assert '# TYPE timeouts_total counter\ntimeouts_total 7\n' in text
+
+    def test_label_values_are_escaped(self):
+        """Test quotes and backslashes in label values are escaped"""
+        registry = Registry()
+        gauge = registry.register(Gauge('g', 'G', ('path',)))
+        gauge.set(1, 'a"b\\c')
+        assert 'g{path="a\\"b\\\\c"} 1' in registry.render()
+
+
+class TestMetricsEndpoint:
+    """Test metrics endpoint"""
+
+    def test_request_metrics_exposed(self, monkeypatch):
+        """Test handled request is counted in latency histogram rendered in Prometheus text format"""
+        monkeypatch.setattr(settings, 'RATE_LIMIT_ENABLED', False)
+        assert client.get("/checks/health").status_code == 200
+        response = client.get("/checks/metrics")
+        assert response.status_code == 200
+        assert response.headers['content-type'] == CONTENT_TYPE
+        labels = 'method="GET",route="/checks/health",status="200"'
+        assert '# TYPE http_request_duration_seconds histogram' in response.text
+        assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} ' in response.text
+        count = re.search(rf'^http_request_duration_seconds_count{{{re.escape(labels)}}} (\d+)$', response.text, re.M)
+        assert count is not None and int(count.group(1)) >= 1
+        assert '# TYPE http_requests_in_flight gauge' in response.text
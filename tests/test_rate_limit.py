@@ -0,0 +1,61 @@
+import pytest
+from httpx import AsyncClient
+from redis import asyncio as aioredis
+from app.api import middleware
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.utils.rate_limit import LocalRateLimiter, RateLimit, RateLimiter, retry_after_header
+
+
+class TestRateLimiter:
+    """Test token bucket rate limiter"""
+
+    def test_local_bucket(self):
+        """Test bucket allows its capacity and then asks to wait for refill"""
+        limiter = LocalRateLimiter(maxsize=10)
+        limit = RateLimit(capacity=2, period=60)
+        assert limiter.hit('client', limit)[0]
+        assert limiter.hit('client', limit)[0]
+        allowed, retry_after = limiter.hit('client', limit)
+        assert not allowed
+        assert 0 < retry_after <= 30
+        assert retry_after_header(retry_after) == str(int(retry_after) + 1)
+        # Buckets of other clients are independent
+        assert limiter.hit('other-client', limit)[0]
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_local_buckets(self):
+        """Test limiter keeps limiting when Redis is unavailable"""
+        redis = aioredis.Redis(host='127.0.0.1', port=1)
+        limiter = RateLimiter(redis)
+        limit = RateLimit(capacity=1, period=60)
+        assert (await limiter.hit('client', limit))[0]
+        assert not (await limiter.hit('client', limit))[0]
+        await redis.aclose()
+
+
+class TestRateLimitMiddleware:
+    """Test rate limiting of endpoints"""
+
+    @pytest.mark.asyncio
+    async def test_requests_over_limit_rejected(self, async_client: AsyncClient, monkeypatch):
+        """Test client over the limit of the most specific prefix gets 429, users and addresses have own buckets"""
+        monkeypatch.setattr(settings, 'RATE_LIMIT_ENABLED', True)
+        monkeypatch.setattr(middleware, 'rate_limits', middleware.sort_rate_limits({
+            '/checks': (100, 60),
+            '/checks/health': (2, 60),
+        }))
+        # 1. Anonymous client spends its bucket of /checks/health
+        for _ in range(2):
+            response = await async_client.get("/checks/health")
+            assert response.status_code == 200
+        response = await async_client.get("/checks/health")
+        assert response.status_code == 429
+        assert 0 < int(response.headers['Retry-After']) <= 30
+        # 2. Other prefix has its own bucket
+        response = await async_client.get("/checks/metrics")
+        assert response.status_code == 200
+        # 3. Authenticated user is limited by its id, not by address
+        token = create_access_token({'id': -20, 'sub': 'rate-limited-user', 'name': 'name', 'surname': 'surname'})
+        response = await async_client.get("/checks/health", headers={'Authorization': 'Bearer ' + token})
+        assert response.status_code == 200
@@ -0,0 +1,97 @@
+import threading
+import time
+import pytest
+from fastapi import HTTPException
+from app.core.security import (CryptoPool, hash_password_async, verify_password_async, verify_token_async,
+                               create_refresh_token_uuid, HmacTokenHasher, BcryptTokenHasher, create_access_token,
+                               get_user_from_token, access_token_cache)
+from app.utils.cache import ExpiringLRUCache
+
+
+class TestCryptoPool:
+    """Test offloading of crypto to thread pool"""
+
+    @pytest.mark.asyncio
+    async def test_hash_and_verify_password(self):
+        """Password hashed in pool is verified in pool"""
+        hashed = await hash_password_async('password')
+        assert await verify_password_async('password', hashed)
+        assert not await verify_password_async('wrong-password', hashed)
+
+    @pytest.mark.asyncio
+    async def test_runs_outside_event_loop_thread(self):
+        """Job is executed by pool thread"""
+        pool = CryptoPool(max_workers=1, max_pending=1)
+        thread_name = await pool.run(lambda: threading.current_thread().name)
+        assert thread_name.startswith('crypto')
+        pool.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_queue_is_full(self):
+        """Job over pending limit is rejected with 503"""
+        pool = CryptoPool(max_workers=1, max_pending=0)
+        with pytest.raises(HTTPException) as ex:
+            await pool.run(lambda: None)
+        assert ex.value.status_code == 503
+        pool.shutdown()
+
+
+class TestTokenHashing:
+    """Test hashing of refresh tokens"""
+
+    @pytest.mark.asyncio
+    async def test_hmac_token_hash(self):
+        """Token hashed with HMAC is verified"""
+        hasher = HmacTokenHasher()
+        hashed = hasher.hash('token')
+        assert hashed.startswith(HmacTokenHasher.prefix)
+        assert await verify_token_async('token', hashed)
+        assert not await verify_token_async('other-token', hashed)
+
+    @pytest.mark.asyncio
+    async def test_legacy_bcrypt_token_hash(self):
+        """Token hashed with bcrypt before migration is still verified"""
+        hashed = BcryptTokenHasher().hash('token')
+        assert await verify_token_async('token', hashed)
+        assert not await verify_token_async('other-token', hashed)
+
+    @pytest.mark.asyncio
+    async def test_refresh_token_uuid(self):
+        """Refresh token is verified against its hash"""
+        token, hashed = create_refresh_token_uuid()
+        assert await verify_token_async(str(token), hashed)
+        assert not await verify_token_async(str(token), 'garbage')
+
+
+class TestAccessTokenCache:
+    """Test cache of decoded access tokens"""
+
+    def test_token_decoded_once(self):
+        """Second lookup of the same token is served from cache"""
+        token = create_access_token({'id': 1, 'sub': 'cached-user'})
+        hits = access_token_cache.hits
+        current_user = get_user_from_token(token)
+        assert current_user.login == 'cached-user'
+        assert get_user_from_token(token) is current_user
+        assert access_token_cache.hits == hits + 1
+
+    def test_entry_expires(self):
+        """Entry is evicted at its expiration time"""
+        cache = ExpiringLRUCache(maxsize=10)
+        cache.set('fresh', 1, time.time() + 60)
+        cache.set('expired', 2, time.time() - 1)
+        assert cache.get('fresh') == 1
+        assert cache.get('expired') is None
+        assert len(cache) == 1
+
+    def test_lru_eviction(self):
+        """Least recently used entry is evicted when cache is full"""
+        cache = ExpiringLRUCache(maxsize=2)
+        expires_at = time.time() + 60
+        cache.set('a', 1, expires_at)
+        cache.set('b', 2, expires_at)
+        cache.get('a')
+        cache.set('c', 3, expires_at)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import time
+import pytest
+from redis.asyncio import Redis
+from app.core.security import REDIS_USERS_TOKEN_DATA_KEY, REDIS_USERS_TOKEN_EXPIRY_KEY, REFRESH_TOKEN_EXPIRATION_TIME
+from app.services.auth_service import session_expiry_member
+from app.services.session_sweeper import SessionSweeper
+
+
+async def add_session(redis: Redis, login: str, fingerprint: str, expires_at: float, scored_at: float | None = None):
+    """Store session the way login does, scored_at overrides its score in expiry set"""
+    await redis.hset(f'{REDIS_USERS_TOKEN_DATA_KEY}:{login}', fingerprint,
+                     json.dumps({'user_id': 1, 'refresh_token': 'token', 'expires_at': expires_at}))
+    await redis.zadd(REDIS_USERS_TOKEN_EXPIRY_KEY,
+                     {session_expiry_member(login, fingerprint): expires_at if scored_at is None else scored_at})
+
+
+class TestSessionSweeper:
+    """Test deletion of expired sessions"""
+
+    @pytest.mark.asyncio
+    async def test_sweep_deletes_only_expired_sessions(self, redis: Redis):
+        """Test a sweep pass removes expired sessions and keeps live ones"""
+        now = time.time()
+        for number in range(3):
+            await add_session(redis, 'sweep-user', f'expired-{number}', now - 60)
+        await add_session(redis, 'sweep-user', 'live', now + 3600)
+        # Renewed after being scored: its member is dropped, but session is kept
+        await add_session(redis, 'sweep-user', 'renewed', now + 3600, scored_at=now - 60)
+
+        # Batches smaller than number of expired sessions
+        await SessionSweeper(redis, batch_size=2).sweep()
+
+        assert sorted(await redis.hkeys(f'{REDIS_USERS_TOKEN_DATA_KEY}:sweep-user')) == ['live', 'renewed']
+        members = set(await redis.zrange(REDIS_USERS_TOKEN_EXPIRY_KEY, 0, -1))
+        assert session_expiry_member('sweep-user', 'live') in members
+        for fingerprint in ('expired-0', 'expired-1', 'expired-2', 'renewed'):
+            assert session_expiry_member('sweep-user', fingerprint) not in members
+
+    @pytest.mark.asyncio
+    async def test_sweeper_stops_on_shutdown(self, redis: Redis):
+        """Test background sweeper deletes expired sessions and stops when asked"""
+        await add_session(redis, 'sweep-loop-user', 'expired', time.time() - 60)
+        sweeper = SessionSweeper(redis, interval=0.01)
+        sweeper.start()
+        for _ in range(100):
+            if not await redis.hexists(f'{REDIS_USERS_TOKEN_DATA_KEY}:sweep-loop-user', 'expired'):
+                break
+            await asyncio.sleep(0.01)
+        task = sweeper._task
+        await sweeper.stop()
+        assert not await redis.hexists(f'{REDIS_USERS_TOKEN_DATA_KEY}:sweep-loop-user', 'expired')
+        assert task.done()
+        assert sweeper._task is None
+
+    @pytest.mark.asyncio
+    async def test_legacy_session_hashes_expired(self, redis: Redis):
+        """Test hashes stored without TTL get one, while TTL of current hashes is kept"""
+        legacy_hash = f'{REDIS_USERS_TOKEN_DATA_KEY}:legacy-user'
+        current_hash = f'{REDIS_USERS_TOKEN_DATA_KEY}:current-user'
+        await redis.hset(legacy_hash, 'fingerprint', json.dumps({'user_id': 1, 'refresh_token': 'token',
+                                                                 'expires_in': 60, 'created_at': 'created'}))
+        await add_session(redis, 'current-user', 'fingerprint', time.time() + 3600)
+        await redis.expire(current_hash, 3600)
+
+        await SessionSweeper(redis, batch_size=1).expire_legacy_sessions()
+
+        assert 0 < await redis.ttl(legacy_hash) <= REFRESH_TOKEN_EXPIRATION_TIME.total_seconds()
+        assert 0 < await redis.ttl(current_hash) <= 3600
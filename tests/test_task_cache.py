@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from redis.asyncio import Redis
+from app.api import schemas
+from app.services.task_cache import TaskCache
+
+
+class Loader:
+    """Task loader counting database reads"""
+    def __init__(self, task: schemas.Task | None, delay: float = 0):
+        self.task = task
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self) -> schemas.Task:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.task is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return self.task
+
+
+class TestTaskCache:
+    """Test read-through cache of tasks"""
+
+    @pytest.mark.asyncio
+    async def test_hit_and_miss(self, redis: Redis):
+        """Test task is loaded once and then served from cache"""
+        cache = TaskCache(redis)
+        loader = Loader(schemas.Task(id=1001, name='task', user_id=1))
+        assert await cache.get_task(1001, loader) == loader.task
+        assert await cache.get_task(1001, loader) == loader.task
+        assert loader.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_invalidated_after_update(self, redis: Redis):
+        """Test updated task is loaded again after invalidation"""
+        cache = TaskCache(redis)
+        await cache.get_task(1002, Loader(schemas.Task(id=1002, name='old', user_id=1)))
+        await cache.invalidate_task(1002)
+        assert (await cache.get_task(1002, Loader(schemas.Task(id=1002, name='new', user_id=1)))).name == 'new'
+
+    @pytest.mark.asyncio
+    async def test_invalidated_after_delete(self, redis: Redis):
+        """Test deleted task isn't served from cache"""
+        cache = TaskCache(redis)
+        await cache.get_task(1003, Loader(schemas.Task(id=1003, name='task', user_id=1)))
+        await cache.invalidate_many([1003], [1])
+        with pytest.raises(HTTPException):
+            await cache.get_task(1003, Loader(None))
+
+    @pytest.mark.asyncio
+    async def test_stale_load_not_served_after_invalidation(self, redis: Redis):
+        """Test task loaded before concurrent update and stored after its invalidation isn't served"""
+        cache = TaskCache(redis)
+        old = schemas.Task(id=1004, name='old', user_id=1)
+
+        async def load_then_update():
+            # Writer commits and invalidates while reader still holds the old row
+            await cache.invalidate_task(1004)
+            return old
+
+        assert await cache.get_task(1004, load_then_update) == old
+        assert (await cache.get_task(1004, Loader(schemas.Task(id=1004, name='new', user_id=1)))).name == 'new'
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_collapsed(self, redis: Redis):
+        """Test concurrent misses of the same task make a single load"""
+        cache = TaskCache(redis)
+        loader = Loader(schemas.Task(id=1005, name='task', user_id=1), delay=0.05)
+        tasks = await asyncio.gather(*(cache.get_task(1005, loader) for _ in range(10)))
+        assert all(task == loader.task for task in tasks)
+        assert loader.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_version_keys_expire(self, redis: Redis):
+        """Test version keys outlive cached entries but don't stay forever"""
+        cache = TaskCache(redis, ttl=60)
+        await cache.get_task(1007, Loader(schemas.Task(id=1007, name='task', user_id=7)))
+        await cache.invalidate_many([1007], [7])
+        for key in ('task_cache:task:1007:version', 'task_cache:user:7:version'):
+            assert 60 < await redis.ttl(key) <= 120
+
+    @pytest.mark.asyncio
+    async def test_lock_released_after_load(self, redis: Redis):
+        """Test loader releases its own lock and keeps lock taken over by another worker"""
+        cache = TaskCache(redis)
+        await cache.get_task(1008, Loader(schemas.Task(id=1008, name='task', user_id=1)))
+        assert not await redis.exists('task_cache:task:1008:v0:lock')
+
+        async def load_after_takeover():
+            # Lock expired and was taken by another worker
+            await redis.set('task_cache:task:1009:v0:lock', 'other')
+            return schemas.Task(id=1009, name='task', user_id=1)
+
+        await cache.get_task(1009, load_after_takeover)
+        assert await redis.get('task_cache:task:1009:v0:lock') == 'other'
+        await redis.delete('task_cache:task:1009:v0:lock')
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_loader_when_redis_unavailable(self):
+        """Test tasks are loaded from database when Redis is down"""
+        redis = Redis(host='127.0.0.1', port=1)
+        cache = TaskCache(redis)
+        loader = Loader(schemas.Task(id=1006, name='task', user_id=1))
+
+        async def load_tasks():
+            return [loader.task]
+
+        assert await cache.get_task(1006, loader) == loader.task
+        assert await cache.get_user_tasks(1, load_tasks) == [loader.task]
+        await cache.invalidate_task(1006)
+        await cache.invalidate_many([1006], [1])
+        await redis.aclose()
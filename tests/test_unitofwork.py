@@ -0,0 +1,101 @@
+import pytest
+from sqlalchemy import select
+from app.db import models
+from app.utils.unitofwork import UnitOfWork
+from tests.conftest import async_session_maker
+
+
+async def create_user(uow: UnitOfWork, login: str) -> int:
+    user = models.User(login=login)
+    uow.session.add(user)
+    await uow.session.flush()
+    return user.id
+
+
+async def task_names(user_id: int) -> list[str]:
+    """Committed tasks of user, read by a separate session"""
+    async with async_session_maker() as session:
+        result = await session.scalars(select(models.Task.name).where(models.Task.user_id == user_id)
+                                       .order_by(models.Task.id))
+        return list(result)
+
+
+class TestUnitOfWork:
+    """Test unit of work shared by services of a request"""
+
+    @pytest.mark.asyncio
+    async def test_failed_nested_block_rolls_back_its_savepoint_only(self):
+        """Test changes of failed nested block are discarded while outer block commits its own"""
+        uow = UnitOfWork(async_session_maker)
+        try:
+            async with uow:
+                user_id = await create_user(uow, 'uow-nested-user')
+                await uow.task.create({'name': 'kept', 'user_id': user_id})
+                with pytest.raises(RuntimeError):
+                    async with uow:
+                        await uow.task.create({'name': 'discarded', 'user_id': user_id})
+                        raise RuntimeError('failed nested block')
+                # Successful nested block is kept in outer transaction
+                async with uow:
+                    await uow.task.create({'name': 'nested', 'user_id': user_id})
+                    await uow.commit()
+                await uow.commit()
+        finally:
+            await uow.close()
+        assert await task_names(user_id) == ['kept', 'nested']
+
+    @pytest.mark.asyncio
+    async def test_failed_block_rolls_back(self):
+        """Test error in outermost block rolls back its transaction"""
+        uow = UnitOfWork(async_session_maker)
+        try:
+            async with uow:
+                user_id = await create_user(uow, 'uow-commit-user')
+                await uow.commit()
+            with pytest.raises(RuntimeError):
+                async with uow:
+                    await uow.task.create({'name': 'discarded', 'user_id': user_id})
+                    raise RuntimeError('failed block')
+            assert not uow.session.in_transaction()
+        finally:
+            await uow.close()
+        assert await task_names(user_id) == []
+
+    @pytest.mark.asyncio
+    async def test_block_without_commit_discarded(self):
+        """Test changes of blocks exited without commit aren't committed by following blocks"""
+        uow = UnitOfWork(async_session_maker)
+        try:
+            async with uow:
+                user_id = await create_user(uow, 'uow-no-commit-user')
+                await uow.commit()
+            async with uow:
+                await uow.task.create({'name': 'discarded', 'user_id': user_id})
+            async with uow:
+                async with uow:
+                    await uow.task.create({'name': 'nested discarded', 'user_id': user_id})
+                await uow.task.create({'name': 'kept', 'user_id': user_id})
+                await uow.commit()
+        finally:
+            await uow.close()
+        assert await task_names(user_id) == ['kept']
+
+    @pytest.mark.asyncio
+    async def test_session_reused_until_closed(self):
+        """Test blocks of one request share session and transaction, close() releases them"""
+        uow = UnitOfWork(async_session_maker)
+        try:
+            async with uow:
+                session = uow.session
+                await uow.task.get_all(0)
+            # Read-only block isn't rolled back, the next one continues its transaction
+            assert session.in_transaction()
+            async with uow:
+                assert uow.session is session
+                await uow.task.read(0)
+            await uow.close()
+            assert uow.session is None
+            async with uow:
+                assert uow.session is not session
+        finally:
+            await uow.close()
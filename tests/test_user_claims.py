@@ -0,0 +1,45 @@
+import pytest
+from app.services.user_claims import UserClaimsCache
+from app.utils.broadcast import MemoryBroadcastBackend
+
+
+class TestUserClaimsCache:
+    """Test per-worker cache of user claims"""
+
+    claims = {'id': 1, 'sub': 'login', 'name': 'name', 'surname': 'surname', 'roles': None}
+
+    @pytest.mark.asyncio
+    async def test_invalidation_reaches_other_workers(self):
+        """Test invalidation drops claims on every worker sharing the backend"""
+        backend = MemoryBroadcastBackend()
+        worker1, worker2 = UserClaimsCache(backend), UserClaimsCache(backend)
+        worker1.set('login', self.claims)
+        worker2.set('login', self.claims)
+        await worker1.invalidate('login')
+        assert worker1.get('login') is None
+        assert worker2.get('login') is None
+
+    @pytest.mark.asyncio
+    async def test_worker_ignores_own_invalidation(self):
+        """Test claims cached right after own invalidation are kept"""
+        backend = MemoryBroadcastBackend()
+        worker = UserClaimsCache(backend)
+        await worker.invalidate('login')
+        worker.set('login', self.claims)
+        worker._on_message('{"origin": "%s", "login": "login"}' % worker.origin)
+        assert worker.get('login') == self.claims
+
+    def test_claims_expire(self):
+        """Test claims are not returned after ttl"""
+        worker = UserClaimsCache(MemoryBroadcastBackend(), ttl=-1)
+        worker.set('login', self.claims)
+        assert worker.get('login') is None
+
+    def test_cached_claims_are_copies(self):
+        """Test changes of passed or returned claims don't reach cached entry"""
+        worker = UserClaimsCache(MemoryBroadcastBackend())
+        claims = dict(self.claims)
+        worker.set('login', claims)
+        claims['exp'] = 1
+        worker.get('login')['exp'] = 2
+        assert worker.get('login') == self.claims
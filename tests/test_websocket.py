@@ -0,0 +1,162 @@
+import asyncio
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from app.utils.broadcast import MemoryBroadcastBackend
+from app.utils.websocket import ConnectionManager, DISCONNECT_POLICY, parse_task_topic, task_topic
+
+
+class FakeWebSocket:
+    """Websocket stand-in recording sent messages"""
+    client = 'fake-client'
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.sent = []
+        self.accepted = False
+        self.closed = False
+
+    async def accept(self):
+        self.accepted = True
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+class FailingBroadcastBackend(MemoryBroadcastBackend):
+    """Backend whose Redis is down"""
+    async def publish(self, channel: str, message: str):
+        raise RedisConnectionError('Redis is down')
+
+
+class TestConnectionManager:
+    """Test websocket connection manager"""
+
+    @pytest.mark.asyncio
+    async def test_slow_client_does_not_block_broadcast(self):
+        """Broadcast returns immediately even if one of clients is stalled"""
+        manager = ConnectionManager(queue_size=10, send_timeout=5)
+        fast, slow = FakeWebSocket(), FakeWebSocket(delay=3600)
+        await manager.connect(fast)
+        await manager.connect(slow)
+
+        await asyncio.wait_for(manager.broadcast('hello'), timeout=0.1)
+        await asyncio.sleep(0.01)
+        assert fast.sent == ['hello']
+        assert slow.sent == []
+        manager.disconnect(fast)
+        assert list(manager.active_connections) == [slow]
+        await manager.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_slow_client_messages_dropped(self):
+        """Messages over queue size are dropped for slow client"""
+        manager = ConnectionManager(queue_size=2, send_timeout=5)
+        slow = FakeWebSocket(delay=3600)
+        await manager.connect(slow)
+        for i in range(5):
+            await manager.broadcast(f'message-{i}')
+        connection = manager.active_connections[slow]
+        assert connection.slow
+        # Two messages are queued, the rest are dropped
+        assert connection.dropped == 3
+        await manager.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_slow_client_disconnected(self):
+        """Slow client is disconnected under disconnect policy"""
+        manager = ConnectionManager(queue_size=1, send_timeout=5, slow_consumer_policy=DISCONNECT_POLICY)
+        slow = FakeWebSocket(delay=3600)
+        await manager.connect(slow)
+        for i in range(3):
+            await manager.broadcast(f'message-{i}')
+        await asyncio.sleep(0.01)
+        assert slow not in manager.active_connections
+        assert slow.closed
+        await manager.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_stalled_send_times_out(self):
+        """Client stalled longer than send timeout is dropped"""
+        manager = ConnectionManager(queue_size=10, send_timeout=0.01)
+        stalled = FakeWebSocket(delay=3600)
+        await manager.connect(stalled)
+        await manager.broadcast('hello')
+        await asyncio.sleep(0.05)
+        assert stalled not in manager.active_connections
+        await manager.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_broadcast_through_backend(self):
+        """Message broadcast by one worker reaches clients of the other one"""
+        backend = MemoryBroadcastBackend()
+        worker_a = ConnectionManager(backend=backend)
+        worker_b = ConnectionManager(backend=backend)
+        client_a, client_b = FakeWebSocket(), FakeWebSocket()
+        await worker_a.connect(client_a)
+        await worker_b.connect(client_b)
+
+        await worker_a.broadcast('hello')
+        await asyncio.sleep(0.01)
+        assert client_a.sent == ['hello']
+        assert client_b.sent == ['hello']
+        await worker_a.shutdown()
+        await worker_b.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_notify_targets_owner_and_subscribers(self):
+        """Targeted message reaches only owner's sockets and topic subscribers"""
+        manager = ConnectionManager()
+        owner, subscriber, stranger = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect(owner, user_id=1)
+        await manager.connect(subscriber, user_id=2)
+        await manager.connect(stranger, user_id=3)
+        manager.subscribe(subscriber, task_topic(10))
+
+        await manager.notify('done', users=[1], topics=[task_topic(10)])
+        await asyncio.sleep(0.01)
+        assert owner.sent == ['done']
+        assert subscriber.sent == ['done']
+        assert stranger.sent == []
+
+        manager.unsubscribe(subscriber, task_topic(10))
+        manager.disconnect(owner)
+        assert not manager.topic_connections
+        assert 1 not in manager.user_connections
+        await manager.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_unavailable_backend_delivers_locally(self):
+        """Failed publish doesn't raise, message still reaches clients of this worker"""
+        manager = ConnectionManager(backend=FailingBroadcastBackend())
+        client = FakeWebSocket()
+        await manager.connect(client, user_id=1)
+
+        await manager.broadcast('hello')
+        await manager.notify('done', users=[1])
+        await asyncio.sleep(0.01)
+        assert client.sent == ['hello', 'done']
+        await manager.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_topics_per_connection_limited(self):
+        """Connection can't subscribe to more topics than allowed"""
+        manager = ConnectionManager(max_topics=2)
+        client = FakeWebSocket()
+        await manager.connect(client, user_id=1)
+        assert manager.subscribe(client, task_topic(1))
+        assert manager.subscribe(client, task_topic(2))
+        assert not manager.subscribe(client, task_topic(3))
+        # Subscribing again to the same topic doesn't take a new slot
+        assert manager.subscribe(client, task_topic(2))
+        assert set(manager.topic_connections) == {task_topic(1), task_topic(2)}
+        await manager.shutdown()
+
+    def test_parse_task_topic(self):
+        """Only topics of form task:<id> are recognized"""
+        assert parse_task_topic(task_topic(42)) == 42
+        for topic in ('task:', 'task:-1', 'task:1.5', 'task:١', 'user:1', 'task:' + '9' * 19):
+            assert parse_task_topic(topic) is None